@@ -0,0 +1,59 @@
+"""
+Benchmarks utils.misc.convert_to_json on a 10k-row frame against the previous per-row render/parse/serialize approach.
+Run from the app folder: python benchmarks/convert_to_json_benchmark.py
+"""
+import json
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.misc import convert_to_json, render_jinja, get_json_schema_template_name
+
+ROWS = 10000
+RUNS = 5
+
+class LinuxMachine():
+    """
+    Stands in for the validation class, only its name is used to find the template.
+    """
+
+def make_df(rows):
+    return pd.DataFrame({
+        'hostname': [f"host{index}" for index in range(rows)],
+        'ipaddress': [f"10.0.{index // 256 % 256}.{index % 256}" for index in range(rows)],
+        'datacenter': ['dc1'] * rows,
+        'island': ['island1'] * rows,
+        'domain': ['example.com'] * rows,
+        'is_valid': [True] * rows,
+    })
+
+def convert_to_json_per_row(df, cls_obj):
+    """
+    The previous implementation: a template lookup, a render, a parse and a serialize per row.
+    """
+    df_to_convert = df.copy(deep=True).replace('None', '').drop(columns=['is_valid'])
+    template_name = get_json_schema_template_name(cls_obj)
+    json_list = [json.loads(render_jinja(template_name, **row)) for row in df_to_convert.to_dict('records')]
+    return json.dumps(json_list)
+
+def bench(func, df):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func(df, LinuxMachine)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+if __name__ == '__main__':
+    df = make_df(ROWS)
+    assert json.loads(convert_to_json(df, LinuxMachine)) == json.loads(convert_to_json_per_row(df, LinuxMachine))
+
+    per_row = bench(convert_to_json_per_row, df)
+    batched = bench(convert_to_json, df)
+    print(f"{ROWS} rows, best of {RUNS} runs")
+    print(f"per row render + parse + serialize: {per_row * 1000:.1f} ms")
+    print(f"compiled template, single pass:     {batched * 1000:.1f} ms")
+    print(f"speedup: {per_row / batched:.1f}x")
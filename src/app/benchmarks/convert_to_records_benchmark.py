@@ -0,0 +1,55 @@
+"""
+Benchmarks the submission records conversion on a large edit, against the previous cached and copying conversion.
+Run from the app folder: python benchmarks/convert_to_records_benchmark.py
+"""
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from components.pages.service_page import convert_to_records
+
+ROWS = 50000
+CHANGED_ROWS = 5000
+RUNS = 5
+
+def make_df(rows):
+    return pd.DataFrame({
+        'hostname': [f"host{index}" for index in range(rows)],
+        'ipaddress': [f"10.0.{index // 256 % 256}.{index % 256}" for index in range(rows)],
+        'datacenter': ['dc1'] * rows,
+        'island': ['island1'] * rows,
+        'domain': ['example.com'] * rows,
+        'is_valid': [True] * rows,
+    })
+
+def convert_to_records_copying(df, index):
+    """
+    The previous path: a subset frame per action, hashed for the st.cache_data key, deep copied, then converted.
+    """
+    subset_df = df.loc[index]
+    pd.util.hash_pandas_object(subset_df)  # stands in for the st.cache_data argument hashing
+    record_list = subset_df.copy(deep=True).drop(columns=['is_valid']).to_dict('records')
+    return [ {key:val for key, val in record.items() if val != None} for record in record_list ]
+
+def bench(func, df, index):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func(df, index)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+if __name__ == '__main__':
+    df = make_df(ROWS)
+    index = df.index.isin(range(0, ROWS, ROWS // CHANGED_ROWS))
+
+    assert convert_to_records(df, index) == convert_to_records_copying(df, index)
+
+    before = bench(convert_to_records_copying, df, index)
+    after = bench(convert_to_records, df, index)
+    print(f"{CHANGED_ROWS} changed rows out of {ROWS}, best of {RUNS} runs")
+    print(f"before (hash + copy + convert): {before * 1000:.1f} ms")
+    print(f"after (convert selected rows):  {after * 1000:.1f} ms")
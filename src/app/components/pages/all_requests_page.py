@@ -18,8 +18,8 @@ class AllRequestsPage(RequestsPage):
         self.allow_execute = True
         self.exec_button_label = "Re-Exec Requests"
         
-    def get_page_data(self):
+    def get_page_data(self, filters=None, after=None):
         """
         This function simply gets the data already existing in the db for this page. Meant for overloading.
         """
-        return get_all_requests()
\ No newline at end of file
+        return get_all_requests(filters, after, self.page_size)
\ No newline at end of file
@@ -18,8 +18,14 @@ class ApproveRequestsPage(RequestsPage):
         self.allow_execute = True
         self.exec_button_label = "Approve Requests"
             
-    def get_page_data(self):
+    def get_page_data(self, filters=None, after=None):
         """
         This function simply gets the data already existing in the db for this page. Meant for overloading.
         """
-        return get_requests_for_approval()
\ No newline at end of file
+        return get_requests_for_approval(filters, after, self.page_size)
+    
+    def get_export_filters(self, filters):
+        """
+        Returns the filters of the requests to export, all the requests matching the page filters. Meant for overloading.
+        """
+        return { **filters, 'status': ['APPROVAL_PENDING'] }
\ No newline at end of file
@@ -2,6 +2,7 @@ from pydantic import ValidationError
 import streamlit as st
 import pandas as pd
 from db.requests import get_my_requests
+from db.projects import get_project
 from utils.validation.request import Request
 from .requests_page import RequestsPage
 
@@ -18,8 +19,14 @@ class MyRequestsPage(RequestsPage):
         
         self.allow_execute = False
             
-    def get_page_data(self):
+    def get_page_data(self, filters=None, after=None):
         """
         This function simply gets the data already existing in the db for this page. Meant for overloading.
         """
-        return get_my_requests()
\ No newline at end of file
+        return get_my_requests(filters, after, self.page_size)
+    
+    def get_export_filters(self, filters):
+        """
+        Returns the filters of the requests to export, all the requests matching the page filters. Meant for overloading.
+        """
+        return { **filters, 'project': str(get_project()['_id']) }
\ No newline at end of file
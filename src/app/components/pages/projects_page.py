@@ -33,6 +33,13 @@ class ProjectsPage(ServicePage):
         elif action_type == ActionType.DELETE:
             delete_projects(submitted_objects)
         
+    def submit_all(self, submissions):
+        """
+        Handles the submission of all the actions of one submit, projects are written directly and not through requests.
+        """
+        for action_type, submitted_objects in submissions.items():
+            self.submit_logic(submitted_objects, action_type)
+        
     def get_page_data(self):
         return get_projects()
     
@@ -1,9 +1,12 @@
 from pydantic import ValidationError
 import streamlit as st
 import pandas as pd
-from db.requests import get_my_requests, update_requests
+from datetime import datetime, time, timezone
+from db.requests import get_my_requests, update_requests, iter_requests, PAGE_SIZE
+from utils.export import EXPORT_FORMATS, export_bytes
+from utils.misc import df_to_records
 from utils.requests import execute_requests
-from utils.validation.request import Request
+from utils.validation.request import Request, StatusType
 
 class RequestsPage():
     """
@@ -31,10 +34,11 @@ class RequestsPage():
 
         try:
             exec_status = execute_requests(requests_to_execute)
+            # requests that didn't run yet have no results, their missing cells must be None and not NaN
             if exec_status:
-                requests_to_execute = requests_to_execute.assign(status='APPROVED').to_dict('records')
+                requests_to_execute = df_to_records(requests_to_execute.assign(status='APPROVED'))
             else:
-                requests_to_execute = requests_to_execute.assign(status='FAILED').to_dict('records')
+                requests_to_execute = df_to_records(requests_to_execute.assign(status='FAILED'))
             update_requests(requests_to_execute)
         except Exception as err:
             st.exception(err)
@@ -62,7 +66,8 @@ class RequestsPage():
         
         st.session_state[self.error_df_name] = st.session_state[self.error_df_name].iloc[0:0].copy()
         
-        df_dict = df.to_dict(orient="records")
+        # requests that didn't run yet have no results, their missing cells must be None and not NaN
+        df_dict = df_to_records(df)
         validated_dict = []
         
         for index, obj in enumerate(df_dict):
@@ -79,11 +84,80 @@ class RequestsPage():
             
         return df
     
-    def get_page_data(self):
+    def get_page_data(self, filters=None, after=None):
         """
         This function simply gets the data already existing in the db for this page. Meant for overloading.
         """
-        return get_my_requests()
+        return get_my_requests(filters, after, self.page_size)
+    
+    def page_filters(self):
+        """
+        Shows the filter widgets, and returns the selected filters.
+        """
+        with st.expander("Filters"):
+            col_status, col_type, col_project, col_dates = st.columns(4)
+            status = col_status.multiselect("Status", [status.value for status in StatusType], key=f"{self.url_pathname}_filter_status")
+            request_type = col_type.text_input("Request type", key=f"{self.url_pathname}_filter_type")
+            project = col_project.text_input("Project", key=f"{self.url_pathname}_filter_project")
+            dates = col_dates.date_input("Request date", value=[], key=f"{self.url_pathname}_filter_dates")
+        
+        filters = {}
+        if len(status) != 0:
+            filters['status'] = status
+        if request_type != '':
+            filters['request_type'] = [request_type]
+        if project != '':
+            filters['project'] = project
+        if len(dates) > 0:
+            filters['date_from'] = datetime.combine(dates[0], time.min, tzinfo=timezone.utc)
+        if len(dates) > 1:
+            filters['date_to'] = datetime.combine(dates[1], time.max, tzinfo=timezone.utc)
+            
+        return filters
+    
+    def get_export_filters(self, filters):
+        """
+        Returns the filters of the requests to export, all the requests matching the page filters. Meant for overloading.
+        """
+        return filters
+    
+    def export_data(self, filters):
+        """
+        Handles the export of all the requests matching the filters as Parquet or NDJSON.
+        The requests are streamed from the db, and the file is only built when the user asks for it.
+        """
+        export_format = st.selectbox("Export format", list(EXPORT_FORMATS.keys()), key=f"{self.url_pathname}_export_format")
+        if st.button("Prepare Export", key=f"{self.url_pathname}_export_btn", icon=":material/file_export:"):
+            writer, extension, mime = EXPORT_FORMATS[export_format]
+            records = iter_requests(self.get_export_filters(filters))
+            # the columns come from the model, requests that didn't run yet have no results in their records
+            columns = list(Request.model_fields.keys())
+            st.download_button(
+                label=f"Download {export_format}",
+                data=export_bytes(writer(records, columns)),
+                file_name=f"{self.url_pathname}.{extension}",
+                mime=mime,
+                icon=":material/prayer_times:",
+                key=f"{self.url_pathname}_export_download",
+            )
+    
+    def page_navigation(self, next_after):
+        """
+        Shows the previous/next page buttons. The cursor of each visited page is kept, so we can go back.
+        """
+        cursors = st.session_state[self.cursors_name]
+        col_prev, col_page, col_next = st.columns([1, 1, 1])
+        
+        if col_prev.button("Previous", icon=":material/arrow_back:", key=f"{self.url_pathname}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+            
+        col_page.write(f"Page {len(cursors)}")
+        
+        # the db tells if there are more requests, the page can be short when requests of deleted projects are skipped
+        if col_next.button("Next", icon=":material/arrow_forward:", key=f"{self.url_pathname}_next", disabled=next_after is None):
+            cursors.append(next_after)
+            st.rerun()
     
     def run_page(self):
         """
@@ -94,9 +168,19 @@ class RequestsPage():
         self.error_df_name = f"df_{__file__}_error"
         self.select_df_name = f"df_{__file__}_select"
         self.df_name = f"df_{__file__}"
+        self.cursors_name = f"cursors_{self.url_pathname}"
+        self.filters_name = f"filters_{self.url_pathname}"
+        self.page_size = PAGE_SIZE
+        
+        filters = self.page_filters()
+        
+        if self.cursors_name not in st.session_state or st.session_state[self.filters_name] != filters:
+            # the first page has no cursor, start over when the filters change
+            st.session_state[self.cursors_name] = [None]
+            st.session_state[self.filters_name] = filters
         
-        request_data = self.get_page_data()
-        st.session_state[self.df_name] = pd.DataFrame(request_data)
+        page_data = self.get_page_data(filters, st.session_state[self.cursors_name][-1])
+        st.session_state[self.df_name] = pd.DataFrame(page_data['requests'])
         
         columns_to_display = list(st.session_state[self.df_name].columns)
         exclude = ['_id', 'id']
@@ -110,6 +194,12 @@ class RequestsPage():
             
         st.session_state[self.df_name] = self.validate_df(st.session_state[self.df_name])
         
+        if 'progress' in st.session_state[self.df_name].columns:
+            # execution progress of each request, as a fraction of its done objects
+            to_completion = lambda progress: progress['done'] / progress['total'] if isinstance(progress, dict) and progress.get('total') else None
+            st.session_state[self.df_name] = st.session_state[self.df_name].assign(completion=st.session_state[self.df_name]['progress'].map(to_completion))
+            columns_to_display.append('completion')
+        
         if not st.session_state[self.error_df_name].empty:
             st.error(f"The values are not valid!")
             st.subheader('Errors')
@@ -129,6 +219,17 @@ class RequestsPage():
                     help="JSON strings or objects",
                     width="large",
                 ),
+                "object_results": st.column_config.JsonColumn(
+                    "execution results",
+                    help="The execution result of each request object",
+                    width="large",
+                ),
+                "completion": st.column_config.ProgressColumn(
+                    "completion",
+                    help="The share of request objects already executed",
+                    min_value=0,
+                    max_value=1,
+                ),
             },
             key = self.select_df_name,
             on_select="rerun",
@@ -139,6 +240,10 @@ class RequestsPage():
             width=10000,
         )
 
+        self.page_navigation(page_data['next_after'])
+        
+        self.export_data(filters)
+
         if self.allow_execute:
             st.button(
                 label=self.exec_button_label,
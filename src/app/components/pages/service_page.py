@@ -3,29 +3,73 @@ import pandas as pd
 import enum
 import re
 import numpy as np
-from pydantic import ValidationError
+import functools
+import time
+from pydantic import ValidationError, TypeAdapter
 from jinja2 import TemplateNotFound
-from db.requests import insert_request
+from db.requests import insert_requests
 from mongo_db import init_service_collection
-from utils.misc import highlight_is_valid, convert_to_json
+from utils.misc import highlight_is_valid, convert_to_json, df_to_records
+from utils.session_memory import register_page_state, enforce_memory_budget
+from utils.export import EXPORT_FORMATS, iter_df_records, iter_parquet_chunks, values_as_str, export_bytes
 from utils.validation.request import ActionType
 from db.services import get_my_service_objects
+from utils.logger import logger
 
-@st.cache_data
-def convert_to_records(df):
+def convert_to_records(df, index=None):
     """
-    Converts the dataframe to a list of objects.
-    Also replaces the string 'None' values with empty strings.
-    This functions result is cached.
+    Converts the dataframe to a list of objects, only the rows selected by index if given (labels or a boolean mask).
+    The dataframe isn't copied or cached, only the selected rows are converted.
     This is for request submission into the db.
     """
-    record_list = df.copy(deep=True).drop(columns=['is_valid']).to_dict('records')
-
+    columns = [col for col in df.columns if col != 'is_valid']
+    selected_df = df.loc[index, columns] if index is not None else df.loc[:, columns]
+    
     # get rid of None values
-    record_list = [ {key:val for key, val in record.items() if val != None} for record in record_list ] 
+    record_list = [ {key:val for key, val in record.items() if val is not None} for record in df_to_records(selected_df) ]
 
     return record_list
 
+# arrow backed strings take a fraction of the memory of python string objects
+STRING_DTYPE = "string[pyarrow]"
+
+def compact_df(df, category_options=None):
+    """
+    Returns the dataframe with compact dtypes instead of python objects.
+    Columns with a fixed set of options (selectbox columns) are stored as categories, the other text columns as arrow strings.
+    category_options maps a column to its options, existing values outside the options are kept as categories as well.
+    """
+    category_options = category_options or {}
+    compacted = {}
+    for col in df.columns:
+        if col == 'is_valid':
+            compacted[col] = df[col]
+        elif col in category_options:
+            values = df[col].dropna().unique().tolist()
+            categories = list(dict.fromkeys([*category_options[col], *values]))
+            compacted[col] = df[col].astype(pd.CategoricalDtype(categories=categories))
+        else:
+            compacted[col] = df[col].astype(STRING_DTYPE)
+    return pd.DataFrame(compacted, index=df.index)
+
+def has_object_columns(df):
+    """
+    Returns True if a data column fell back to the object dtype, e.g. after a concat with new rows.
+    """
+    return any(dtype == object for col, dtype in df.dtypes.items() if col != 'is_valid')
+
+# the number of rows read and validated at once on upload
+UPLOAD_CHUNK_SIZE = 1000
+# the max number of rows in an uploaded file
+UPLOAD_MAX_ROWS = 50000
+
+@functools.lru_cache
+def get_list_adapter(cls_obj):
+    """
+    Returns a pydantic TypeAdapter for a list of the validation class, built once per class.
+    """
+    return TypeAdapter(list[cls_obj])
+
 class ServicePage():
     """
     This class exists to support the multipage architecture. This is a generic service type page.
@@ -46,6 +90,56 @@ class ServicePage():
         self.url_pathname = '-'.join(lower_split_name)
         self.page_title = ' '.join(split_name)
         
+        ### Set up column config with the selectbox for Enum attributes
+        # the page objects are shared by all the sessions, so all of this is set once here and never changed by a run
+        cls_name = self.cls['name']
+        cls_obj = self.cls['obj']
+        self.members = list(cls_obj.model_fields.keys())
+        
+        self.column_cfg={
+            "is_valid": st.column_config.TextColumn("IsValid", width="large", default=False),
+        }
+        # the options of the selectbox columns, these are stored as categories
+        self.category_options = {}
+        
+        for member in self.members:
+            member_type = cls_obj.model_fields[member].annotation
+            try:
+                is_enum = issubclass(member_type, enum.Enum)
+            except:
+                is_enum = False
+            if is_enum:
+                member_values = [el.value for el in member_type]
+                self.category_options[member] = member_values
+                self.column_cfg.update({member: st.column_config.SelectboxColumn(
+                    f"{member.capitalize()}",
+                    help=cls_obj.model_fields[member].description,
+                    width="large",
+                    options=member_values,
+                    required=True,
+                )})
+            else:
+                self.column_cfg.update({member: st.column_config.TextColumn(
+                    f"{member.capitalize()}",
+                    help=cls_obj.model_fields[member].description,
+                    width="large",
+                    required=True,
+                )})
+        
+        ### session data setup
+        
+        self.df_columns = list([*self.members, 'is_valid'])
+                
+        self.df_name = f"df_{cls_name}"
+        self.error_df_name = f"df_{cls_name}_error"
+        self.edited_df_name = f"df_{cls_name}_edited"
+        self.added_set_name = f"added_set_{cls_name}"
+        self.edited_set_name = f"edited_set_{cls_name}"
+        self.deleted_df_name = f"df_{cls_name}_deleted"
+        self.validation_cache_name = f"validation_cache_{cls_name}"
+        self.df_version_name = f"df_{cls_name}_version"
+        self.json_payload_name = f"json_payload_{cls_name}"
+        
     def validate_obj(self, obj):
         """
         Runs a pydantic validation on the object passed.
@@ -59,80 +153,162 @@ class ServicePage():
             
         return validated_obj
 
+    def validate_records(self, records):
+        """
+        Runs a pydantic batch validation on a list of records.
+        Returns a (validated object, errors) tuple for each record, errors is a dict of column to error message.
+        """
+        adapter = get_list_adapter(self.cls['obj'])
+        try:
+            validated_objs = adapter.validate_python(records)
+            return [(obj.model_dump(object_id_to_str=True), {}) for obj in validated_objs]
+        except ValidationError as err:
+            results = [(None, {}) for _ in records]
+            for err_inst in err.errors():
+                # the first loc item is the position in the list
+                row_pos, *loc = err_inst['loc']
+                invalid_col = loc[0] if len(loc) != 0 else 'is_valid'
+                results[row_pos][1][invalid_col] = err_inst['msg']
+        
+        # validate the rows without errors again, to get their validated values
+        valid_positions = [pos for pos, (_, errors) in enumerate(results) if len(errors) == 0]
+        valid_results = self.validate_records([records[pos] for pos in valid_positions]) if len(valid_positions) != 0 else []
+        for pos, result in zip(valid_positions, valid_results):
+            results[pos] = result
+            
+        return results
+
     def validate_df(self, df):
         """
         Runs a pydantic validation on the dataframe passed.
         Recreates the error dataframe based on current validation errors.
         Sets the 'is_valid' column on the dataframe based on validation results.
+        Rows with the same content as in the last validation reuse its result.
         """
         if df.empty:
             return df
         
-        st.session_state[self.error_df_name] = st.session_state[self.error_df_name].iloc[0:0].copy()
-        
         df = df.assign(is_valid=True)
+        data_df = df.loc[:, df.columns != 'is_valid']
         
-        df_dict = df.loc[:, df.columns != 'is_valid'].to_dict(orient="records")
-        validated_dict = []
+        row_hashes = pd.util.hash_pandas_object(data_df, index=False).to_list()
+        last_results = st.session_state.get(self.validation_cache_name, {})
+        results = {row_hash: last_results[row_hash] for row_hash in row_hashes if row_hash in last_results}
         
-        for index, obj in enumerate(df_dict):
-            try:
-                validated_obj = self.validate_obj(obj)
+        new_positions = [pos for pos, row_hash in enumerate(row_hashes) if row_hash not in results]
+        if len(new_positions) != 0:
+            new_records = df_to_records(data_df.iloc[new_positions])
+            for pos, result in zip(new_positions, self.validate_records(new_records)):
+                results[row_hashes[pos]] = result
+                
+        # only the current rows are kept, so the cache doesn't grow past the table size
+        st.session_state[self.validation_cache_name] = results
+        
+        errors = {}
+        validated_dict = []
+        for index, row_hash in zip(df.index, row_hashes):
+            validated_obj, row_errors = results[row_hash]
+            if len(row_errors) != 0:
+                errors[index] = row_errors
+            else:
                 validated_dict.append(validated_obj)
-            except ValidationError as err:
-                for err_inst in err.errors():
-                    invalid_col = err_inst['loc'][0]
-                    st.session_state[self.error_df_name].loc[index, invalid_col] = err_inst['msg']
-                    df.loc[index, 'is_valid'] = False
         
-        if st.session_state[self.error_df_name].empty:
+        # build the error dataframe once
+        error_df = st.session_state[self.error_df_name].iloc[0:0]
+        if len(errors) != 0:
+            error_df = pd.concat([error_df, pd.DataFrame.from_dict(errors, orient='index')])
+            df.loc[list(errors.keys()), 'is_valid'] = False
+        st.session_state[self.error_df_name] = error_df
+        
+        if len(errors) == 0:
             # create new df from the validated object list, but keep the old indices to know which rows were deleted/edited/added!
             df = pd.DataFrame.from_records(validated_dict, index=df.index).assign(is_valid=True).replace({np.nan: None})
             
         return df
     
-    def submit_logic(self, submitted_objects, action_type):
+    def validate_rows(self, df, indices):
+        """
+        Runs a pydantic validation on the given rows of the dataframe only.
+        Patches the 'is_valid' column and the error dataframe entries of these rows, the other rows are left as is.
+        Errors of rows no longer in the dataframe are dropped as well.
         """
-        Handles the submission logic itself, based on the action type.
+        indices = set(indices)
+        error_df = st.session_state[self.error_df_name]
+        stale_indices = [index for index in error_df.index if index in indices or index not in df.index]
+        error_df = error_df.drop(index=stale_indices)
+        
+        indices = [index for index in indices if index in df.index]
+        if len(indices) != 0:
+            records = df_to_records(df.loc[indices, df.columns != 'is_valid'])
+            
+            errors = {}
+            valid_indices = []
+            valid_objs = []
+            for index, (validated_obj, row_errors) in zip(indices, self.validate_records(records)):
+                if len(row_errors) != 0:
+                    errors[index] = row_errors
+                else:
+                    valid_indices.append(index)
+                    # the data columns hold text
+                    valid_objs.append({ key: value if value is None or isinstance(value, str) else str(value) for key, value in validated_obj.items() if key in df.columns })
+            
+            if len(valid_objs) == 1:
+                # a single edited row, patch its cells
+                for key, value in valid_objs[0].items():
+                    df.at[valid_indices[0], key] = value
+            elif len(valid_objs) > 1:
+                # write all the validated rows back at once, e.g. for uploads
+                columns = list(valid_objs[0].keys())
+                df.loc[valid_indices, columns] = pd.DataFrame.from_records(valid_objs, index=valid_indices, columns=columns).to_numpy()
+            df.loc[indices, 'is_valid'] = [index not in errors for index in indices]
+                    
+            if len(errors) != 0:
+                error_df = pd.concat([error_df, pd.DataFrame.from_dict(errors, orient='index')])
+                
+        st.session_state[self.error_df_name] = error_df
+        
+        return df
+    
+    def submit_all(self, submissions):
+        """
+        Handles the submission logic itself, for all the actions of one submit.
+        Requests for all the actions are inserted in one transaction.
         """
         # cast the submitted objects to the pydantic class representing them
-        submitted_objects = [ self.cls['obj'](**obj) for obj in submitted_objects ]
+        actions = { action_type: [ self.cls['obj'](**obj) for obj in submitted_objects ] for action_type, submitted_objects in submissions.items() }
         
-        if action_type == ActionType.CREATE:
-            insert_request(self.snake_case_name, ActionType.CREATE, submitted_objects)
-        elif action_type == ActionType.UPDATE:
-            insert_request(self.snake_case_name, ActionType.UPDATE, submitted_objects)
-        elif action_type == ActionType.DELETE:
-            insert_request(self.snake_case_name, ActionType.DELETE, submitted_objects)
+        insert_requests(self.snake_case_name, actions)
         
     def submit_button_on_click(self):
         """
         Handles submission on new request!
         """
         
+        start = time.perf_counter()
+        
         added_indices = st.session_state[self.df_name].index.isin(st.session_state[self.added_set_name])
-        added_objects = st.session_state[self.df_name].loc[added_indices]
-        added_objects = convert_to_records(added_objects)
+        added_objects = convert_to_records(st.session_state[self.df_name], added_indices)
         
         edited_indices = st.session_state[self.df_name].index.isin(st.session_state[self.edited_set_name])
-        edited_objects = st.session_state[self.df_name].loc[edited_indices]
-        edited_objects = convert_to_records(edited_objects)
+        edited_objects = convert_to_records(st.session_state[self.df_name], edited_indices)
 
         objects_to_delete = convert_to_records(st.session_state[self.deleted_df_name])
         
+        logger.info(f"Converted {len(added_objects)} added, {len(edited_objects)} edited and {len(objects_to_delete)} deleted {self.cls['name']} objects in {(time.perf_counter() - start) * 1000:.1f} ms")
+        
+        submissions = {
+            ActionType.CREATE: added_objects,
+            ActionType.UPDATE: edited_objects,
+            ActionType.DELETE: objects_to_delete,
+        }
+        submissions = { action_type: objects for action_type, objects in submissions.items() if len(objects) != 0 }
+        
         try:
-            if len(added_objects) != 0:
-                self.submit_logic(added_objects, ActionType.CREATE)
-                del st.session_state[self.added_set_name]
-                
-            if len(edited_objects) != 0:
-                self.submit_logic(edited_objects, ActionType.UPDATE)
-                del st.session_state[self.edited_set_name]
-                
-            if len(objects_to_delete) != 0:
-                self.submit_logic(objects_to_delete, ActionType.DELETE)
-                del st.session_state[self.deleted_df_name]
-                
+            self.submit_all(submissions)
+            
+            del st.session_state[self.added_set_name]
+            del st.session_state[self.edited_set_name]
+            del st.session_state[self.deleted_df_name]
             del st.session_state[self.df_name]
                 
         except Exception as err:
@@ -142,22 +318,29 @@ class ServicePage():
         """
         Runs on change of the data editor component.
         Handles the changed data, and updates the relevant dataframe.
-        Runs the validation function on the newly changed dataframe.
+        Runs the validation function on the changed rows only.
         """
         state = st.session_state[self.edited_df_name]
+        changed_indices = set()
         
         for index, updates in state["edited_rows"].items():
+            changed_indices.add(index)
             # add to edited rows only if wasn't created now
             if not index in st.session_state[self.added_set_name]:
                 st.session_state[self.edited_set_name].add(index)
             for key, value in updates.items():
                 st.session_state[self.df_name].loc[st.session_state[self.df_name].index == index, key] = value
                 
-        for row in state["added_rows"]:
-            df_row = pd.DataFrame.from_records([row])
-            st.session_state[self.df_name] = pd.concat([st.session_state[self.df_name], df_row], ignore_index=True).replace({np.nan: None})
-            st.session_state[self.added_set_name].add(st.session_state[self.df_name].last_valid_index())
+        if len(state["added_rows"]) != 0:
+            # all added rows are merged with one concat, they get the last indices of the dataframe
+            added_df = pd.DataFrame.from_records(state["added_rows"])
+            st.session_state[self.df_name] = pd.concat([st.session_state[self.df_name], added_df], ignore_index=True).replace({np.nan: None})
+            added_indices = st.session_state[self.df_name].index[-len(added_df):]
+            st.session_state[self.added_set_name].update(added_indices)
+            changed_indices.update(added_indices)
             
+        deleted_indices = []
+        
         for row_index in state["deleted_rows"]:
             # add deleted object to a list that will be made into a DELETE action request
             if not st.session_state[self.df_name].loc[row_index, 'is_valid']:
@@ -167,65 +350,113 @@ class ServicePage():
                 # don't submit request if the row was created now as well
                 st.session_state[self.added_set_name].remove(row_index)
             else:
-                deleted_row = st.session_state[self.df_name].loc[row_index].copy()
-                st.session_state[self.deleted_df_name] = pd.concat([st.session_state[self.deleted_df_name], deleted_row.to_frame().T], ignore_index=True)
-                st.session_state[self.df_name].drop(row_index, inplace=True)
+                deleted_indices.append(row_index)
             
             if row_index in st.session_state[self.edited_set_name]:
                 # deleting the row makes the edits made to it inconsequential, so remove it from the edited rows
                 st.session_state[self.edited_set_name].remove(row_index)
+                
+        if len(deleted_indices) != 0:
+            # all deleted rows are moved to the deleted dataframe with one concat
+            deleted_rows = st.session_state[self.df_name].loc[deleted_indices]
+            st.session_state[self.deleted_df_name] = pd.concat([st.session_state[self.deleted_df_name], deleted_rows], ignore_index=True)
+            st.session_state[self.df_name] = st.session_state[self.df_name].drop(index=deleted_indices)
             
-        st.session_state[self.df_name] = self.validate_df(st.session_state[self.df_name])
+        st.session_state[self.df_name] = self.validate_rows(st.session_state[self.df_name], changed_indices)
+        if has_object_columns(st.session_state[self.df_name]):
+            st.session_state[self.df_name] = compact_df(st.session_state[self.df_name], self.category_options)
+        self.bump_df_version()
+        
+    def read_upload_chunks(self, uploaded_file, file_type):
+        """
+        Returns an iterator over the uploaded file in dataframe chunks of UPLOAD_CHUNK_SIZE rows, all values are read as strings.
+        CSV is read with chunksize, and so is line-delimited JSON. Parquet is read one record batch at a time.
+        A JSON array can't be streamed, so it is read whole and split into chunks.
+        """
+        if file_type == 'csv':
+            return pd.read_csv(uploaded_file, index_col=0, dtype=str, chunksize=UPLOAD_CHUNK_SIZE)
+        
+        if file_type == 'parquet':
+            return iter_parquet_chunks(uploaded_file, UPLOAD_CHUNK_SIZE)
+        
+        first_char = uploaded_file.read(1024).lstrip()[:1]
+        uploaded_file.seek(0)
+        if first_char == b'[':
+            dataframe = values_as_str(pd.read_json(uploaded_file, orient='records', dtype=False))
+            return (dataframe.iloc[start:start + UPLOAD_CHUNK_SIZE] for start in range(0, len(dataframe), UPLOAD_CHUNK_SIZE))
         
+        # json numbers are read as numbers, convert them like the other formats
+        chunks = pd.read_json(uploaded_file, lines=True, dtype=False, chunksize=UPLOAD_CHUNK_SIZE)
+        return (values_as_str(chunk) for chunk in chunks)
+    
     def upload_file(self):
         """
         Handles file uploading into the app.
+        The file is read in chunks, and only the new rows are validated.
         """
         
         if  'file_uploader_key' not in st.session_state:
             st.session_state['file_uploader_key'] = 0
         
-        uploaded_file = st.file_uploader("Choose a CSV/JSON file", key=st.session_state['file_uploader_key'])
-        if uploaded_file is not None:
-            # Can be used wherever a "file-like" object is accepted:
-            file_type = uploaded_file.name.split('.')[1]
-            
-            is_csv = file_type == 'csv'
-            is_json = file_type == 'json'
-            if is_csv:
-                try:
-                    dataframe = pd.read_csv(uploaded_file, index_col=0)
-                except Exception as err:
-                    st.exception(err)
-            elif is_json:
-                try:
-                    dataframe = pd.read_json(uploaded_file, orient='records')
-                except Exception as err:
-                    st.exception(err)
-            else:
-                st.error("File was neither CSV or JSON! Please select a CSV/JSON file!")
-            
-            if is_json or is_csv:
-                
-                dataframe = dataframe.astype(str)
+        uploaded_file = st.file_uploader("Choose a CSV/JSON/NDJSON/Parquet file", key=st.session_state['file_uploader_key'])
+        if uploaded_file is None:
+            return
+        
+        # this is a hack to make this whole function run once for each file uploaded.
+        st.session_state['file_uploader_key'] = st.session_state['file_uploader_key'] + 1
+        
+        file_type = uploaded_file.name.rsplit('.', 1)[-1].lower()
+        if file_type not in ['csv', 'json', 'ndjson', 'jsonl', 'parquet']:
+            st.error("File was neither CSV, JSON, NDJSON or Parquet! Please select a CSV/JSON/NDJSON/Parquet file!")
+            return
+        
+        data_columns = [col for col in st.session_state[self.df_name].columns if col != 'is_valid']
+        progress_bar = st.progress(0.0, text="Reading file...")
+        
+        chunks = []
+        row_count = 0
+        try:
+            for chunk in self.read_upload_chunks(uploaded_file, file_type):
+                row_count += len(chunk)
+                if row_count > UPLOAD_MAX_ROWS:
+                    progress_bar.empty()
+                    st.error(f"File has more than {UPLOAD_MAX_ROWS} rows! Please split it into smaller files.")
+                    return
                 
-                dataframe = self.validate_df(dataframe)
-                # try to add the uploaded df to the saved one, throw exception if columns don't match
-                if dataframe.columns.to_list() == st.session_state[self.df_name].columns.to_list():
-                    try:
-                        st.session_state[self.df_name] = pd.concat([st.session_state[self.df_name], dataframe], ignore_index=True ).replace({np.nan: None})
-                        st.session_state[self.added_set_name].add(st.session_state[self.df_name].last_valid_index())
-                    except Exception as err:
-                        st.exception(err)
-                    
-                    st.session_state[self.df_name] = self.validate_df(st.session_state[self.df_name])
-                    # this is a hack to make this whole function run once for each file uploaded.
-                    st.session_state['file_uploader_key'] = st.session_state['file_uploader_key'] + 1
-                    
-                    st.rerun()
-                else:
+                chunk = chunk.drop(columns=['is_valid'], errors='ignore')
+                if set(chunk.columns) != set(data_columns):
+                    progress_bar.empty()
                     st.error("File didn't have the correct columns! Please load a matching file next time!")
-                    st.session_state['file_uploader_key'] = st.session_state['file_uploader_key'] + 1
+                    return
+                
+                chunks.append(chunk[data_columns])
+                read_fraction = min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0)
+                progress_bar.progress(read_fraction / 2, text=f"Read {row_count} rows...")
+        except Exception as err:
+            progress_bar.empty()
+            st.exception(err)
+            return
+        
+        if row_count == 0:
+            progress_bar.empty()
+            return
+        
+        # add all the uploaded rows with one concat, they get the last indices of the dataframe
+        uploaded_df = pd.concat(chunks, ignore_index=True).replace({np.nan: None})
+        df = pd.concat([st.session_state[self.df_name], uploaded_df], ignore_index=True).replace({np.nan: None})
+        new_indices = list(df.index[-row_count:])
+        st.session_state[self.added_set_name].update(new_indices)
+        
+        # validate only the new rows, chunk by chunk
+        for start in range(0, row_count, UPLOAD_CHUNK_SIZE):
+            df = self.validate_rows(df, new_indices[start:start + UPLOAD_CHUNK_SIZE])
+            validated_count = min(start + UPLOAD_CHUNK_SIZE, row_count)
+            progress_bar.progress(0.5 + validated_count / row_count / 2, text=f"Validated {validated_count}/{row_count} rows...")
+            
+        st.session_state[self.df_name] = compact_df(df, self.category_options)
+        self.bump_df_version()
+        
+        st.rerun()
         
     def submit_request(self):
         """
@@ -252,17 +483,73 @@ class ServicePage():
             on_click=self.submit_button_on_click
         )
         
-        json_obj = convert_to_json(st.session_state[self.df_name], self.cls['obj'])
-
-        st.download_button(
-            label="Download JSON",
-            data=json_obj,
-            file_name=f"{self.snake_case_name}_data.json",
-            mime="text/json",
-            icon=":material/prayer_times:",
-            disabled=submit_disabled,
-            on_click=st.snow
-        )
+        self.download_json(submit_disabled)
+        
+    def bump_df_version(self):
+        """
+        Marks the page dataframe as changed, so payloads built from it are built again.
+        """
+        st.session_state[self.df_version_name] = st.session_state.get(self.df_version_name, 0) + 1
+        
+    def get_json_payload(self):
+        """
+        Returns the JSON download payload of the page dataframe.
+        The payload is kept in the session with the dataframe version, so it is only rendered again after the data changed.
+        """
+        version = st.session_state.get(self.df_version_name, 0)
+        cached = st.session_state.get(self.json_payload_name)
+        if cached is None or cached[0] != version:
+            cached = (version, convert_to_json(st.session_state[self.df_name], self.cls['obj']))
+            st.session_state[self.json_payload_name] = cached
+        return cached[1]
+    
+    def download_json(self, disabled):
+        """
+        Handles the JSON download. The payload is only built once the user asks for it.
+        """
+        cls_name = self.cls['name']
+        version = st.session_state.get(self.df_version_name, 0)
+        cached = st.session_state.get(self.json_payload_name)
+        is_prepared = cached is not None and cached[0] == version
+        
+        if not is_prepared:
+            is_prepared = st.button(
+                label="Prepare JSON",
+                key=f"prepare_json_btn_{cls_name}",
+                icon=":material/prayer_times:",
+                disabled=disabled,
+            )
+        
+        if is_prepared:
+            st.download_button(
+                label="Download JSON",
+                data=self.get_json_payload(),
+                file_name=f"{self.snake_case_name}_data.json",
+                mime="text/json",
+                icon=":material/prayer_times:",
+                disabled=disabled,
+                on_click=st.snow
+            )
+        
+    def export_data(self):
+        """
+        Handles the export of the page data as Parquet or NDJSON.
+        The file is streamed from the dataframe, and only built when the user asks for it.
+        """
+        cls_name = self.cls['name']
+        
+        export_format = st.selectbox("Export format", list(EXPORT_FORMATS.keys()), key=f"export_format_{cls_name}")
+        if st.button("Prepare Export", key=f"export_btn_{cls_name}", icon=":material/file_export:"):
+            writer, extension, mime = EXPORT_FORMATS[export_format]
+            df = st.session_state[self.df_name].drop(columns=['is_valid'])
+            st.download_button(
+                label=f"Download {export_format}",
+                data=export_bytes(writer(iter_df_records(df), list(df.columns))),
+                file_name=f"{self.snake_case_name}_data.{extension}",
+                mime=mime,
+                icon=":material/prayer_times:",
+                key=f"export_download_{cls_name}",
+            )
         
     def get_page_data(self):
         """
@@ -274,53 +561,11 @@ class ServicePage():
         """
         The 'main' fucntion of each page. Runs everything.
         """
-        cls_name = self.cls['name']
-        cls_obj = self.cls['obj']
-        members = list(cls_obj.model_fields.keys())
+        members = self.members
+        df_columns = self.df_columns
         
         st.title(self.page_title)
         
-        ### Set up column config with the selectbox for Enum attributes
-        
-        column_cfg={
-            "is_valid": st.column_config.TextColumn("IsValid", width="large", default=False),
-        }
-        
-        for member in members:
-            member_type = cls_obj.model_fields[member].annotation
-            try:
-                is_enum = issubclass(member_type, enum.Enum)
-            except:
-                is_enum = False
-            if is_enum:
-                member_values = [el.value for el in member_type]
-                column_cfg.update({member: st.column_config.SelectboxColumn(
-                    f"{member.capitalize()}",
-                    help=cls_obj.model_fields[member].description,
-                    width="large",
-                    options=member_values,
-                    required=True,
-                )})
-            else:
-                column_cfg.update({member: st.column_config.TextColumn(
-                    f"{member.capitalize()}",
-                    help=cls_obj.model_fields[member].description,
-                    width="large",
-                    required=True,
-                )})
-        
-        ### session data setup
-        
-        df_columns = list([*members, 'is_valid'])
-                
-        self.df_name = f"df_{cls_name}"
-        self.error_df_name = f"df_{cls_name}_error"
-        self.styled_df_name = f"df_{cls_name}_styled"
-        self.edited_df_name = f"df_{cls_name}_edited"
-        self.added_set_name = f"added_set_{cls_name}"
-        self.edited_set_name = f"edited_set_{cls_name}"
-        self.deleted_df_name = f"df_{cls_name}_deleted"
-        
         if  self.error_df_name not in st.session_state:
             # Create an empty DataFrame with column names
             st.session_state[self.error_df_name] = pd.DataFrame(columns=[*members])
@@ -344,9 +589,13 @@ class ServicePage():
             service_objects_df = pd.DataFrame.from_records(service_objects)
             if not service_objects_df.empty:
                 service_objects_df = self.validate_df(service_objects_df)
-            st.session_state[self.df_name] = pd.DataFrame(service_objects_df, columns=df_columns).astype(str)
+            # only the data columns are read as strings, is_valid stays a bool for the submit check
+            service_objects_df = pd.DataFrame(service_objects_df, columns=df_columns).astype({ **{ col: str for col in members }, 'is_valid': bool })
+            st.session_state[self.df_name] = compact_df(service_objects_df, self.category_options)
+            self.bump_df_version()
         
-        st.session_state[self.styled_df_name] = st.session_state[self.df_name].style.map(highlight_is_valid, subset=pd.IndexSlice[:, ['is_valid']])
+        # the styled frame is only built for rendering, it isn't kept in the session
+        styled_df = st.session_state[self.df_name].style.map(highlight_is_valid, subset=pd.IndexSlice[:, ['is_valid']])
 
         columns_to_display = df_columns
         if 'id' in columns_to_display:
@@ -357,8 +606,8 @@ class ServicePage():
         
         st.subheader('Editor')
         st.data_editor(
-            st.session_state[self.styled_df_name],
-            column_config=column_cfg,
+            styled_df,
+            column_config=self.column_cfg,
             column_order=columns_to_display,
             key=self.edited_df_name,
             disabled=["is_valid"],
@@ -373,6 +622,27 @@ class ServicePage():
         
         if not st.session_state[self.df_name].empty or not st.session_state[self.deleted_df_name].empty:
             self.submit_request()
+            
+        if not st.session_state[self.df_name].empty:
+            self.export_data()
+            
+        self.manage_session_memory()
+        
+    def manage_session_memory(self):
+        """
+        Keeps the session in its memory budget, by evicting the state of pages the user is not viewing.
+        """
+        state_names = [
+            self.df_name, self.error_df_name, self.added_set_name, self.edited_set_name, self.deleted_df_name,
+            self.validation_cache_name, self.df_version_name, self.json_payload_name,
+        ]
+        has_pending_changes = (
+            len(st.session_state.get(self.added_set_name, [])) != 0
+            or len(st.session_state.get(self.edited_set_name, [])) != 0
+            or not st.session_state.get(self.deleted_df_name, pd.DataFrame()).empty
+        )
+        register_page_state(self.cls['name'], state_names, st.session_state.get(self.df_version_name, 0), has_pending_changes)
+        enforce_memory_budget(self.cls['name'])
         
     def get_page(self):
         """
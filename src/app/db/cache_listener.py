@@ -0,0 +1,99 @@
+import threading
+import time
+import pymongo
+import streamlit as st
+from mongo_db import get_database, service_collection_names
+from db.projects import clear_project_caches
+from db.requests import requests_cache, invalidate_requests_cache
+from db.services import services_cache
+from utils.logger import logger
+
+# seconds to wait before opening the change stream again after an error
+RETRY_INTERVAL = 5
+# change stream errors meaning the resume token is no longer in the oplog
+RESUME_TOKEN_LOST_CODES = (280, 286)
+
+# only the fields needed to find the cache entries of a change are sent by the server
+pipeline = [
+    {
+        '$match': {
+            'operationType': { '$in': ['insert', 'update', 'replace', 'delete'] }
+        }
+    },
+    {
+        '$project': {
+            'operationType': 1,
+            'ns': 1,
+            'documentKey': 1,
+            'fullDocument.project': 1
+        }
+    }
+]
+
+def clear_all_caches():
+    """
+    Clears the cache of all the db getter functions.
+    """
+    clear_project_caches()
+    requests_cache.clear()
+    services_cache.clear()
+
+def invalidate_change(change):
+    """
+    Invalidates the cache entries affected by a change.
+    When the project of the changed document is unknown (e.g. a delete), all the entries of the collection are dropped.
+    """
+    coll_name = change['ns']['coll']
+    project_id = (change.get('fullDocument') or {}).get('project')
+
+    if coll_name == 'projects':
+        # the request pages show the project names too
+        clear_project_caches()
+        requests_cache.clear()
+    elif coll_name == 'requests':
+        if project_id is None:
+            requests_cache.clear()
+        else:
+            invalidate_requests_cache([project_id])
+    elif coll_name in service_collection_names:
+        if project_id is None:
+            services_cache.clear()
+        else:
+            services_cache.invalidate((coll_name, str(project_id)))
+
+def listen(db):
+    """
+    Watches the writes to the platform database, from any replica or the runner, and invalidates the affected cache entries.
+    While the stream is down, changes might be missed, so the caches are cleared before opening it again.
+    """
+    resume_token = None
+    while True:
+        try:
+            with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as change_stream:
+                if resume_token is None:
+                    # writes made before the stream was opened are not seen, drop what was cached until now
+                    clear_all_caches()
+                for change in change_stream:
+                    invalidate_change(change)
+                    resume_token = change_stream.resume_token
+        except pymongo.errors.OperationFailure as e:
+            if e.code in RESUME_TOKEN_LOST_CODES:
+                logger.warning("The cache listener resume token is no longer in the oplog, starting from now.")
+                resume_token = None
+            else:
+                logger.exception(e)
+        except Exception as e:
+            logger.exception(e)
+
+        clear_all_caches()
+        time.sleep(RETRY_INTERVAL)
+
+@st.cache_resource
+def start_cache_listener():
+    """
+    Starts the cache listener thread, once per process.
+    """
+    thread = threading.Thread(target=listen, args=(get_database(),), name="cache-listener", daemon=True)
+    thread.start()
+
+    return thread
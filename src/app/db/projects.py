@@ -2,31 +2,54 @@ import streamlit as st
 import json
 from bson import ObjectId as _ObjectId
 from utils.validation.types import ObjectId
-from mongo_db import get_database
+from pymongo import InsertOne, UpdateOne
+from mongo_db import get_database, bulk_write_chunked, service_collection_names
 from typing import List
 from utils.validation.project import Project
 from pydantic import validate_call
+from utils.cache import CACHE_TTL
 
-@st.cache_data(ttl=100)
-def get_project():
+@st.cache_data(ttl=CACHE_TTL)
+def get_group_project_index():
     """
-    Retrieves the matched project for the connected user.
+    Retrieves a map of LDAP group to its project, for all projects.
+    If a group is mapped to multiple projects, the first one found is kept.
     """
     db = get_database()
-    groups_field_name = st.secrets["auth"]["groups_token_field"]
-    subject_groups = st.experimental_user[groups_field_name]
-    projects = db['projects'].find( { 'groups': { '$in': list(subject_groups) } } )
+    projects = db['projects'].find({})
     
-    projects = list(projects)  # if for some reason there are multiple matches
+    group_index = {}
+    for project in projects:
+        for group in project.get('groups', []):
+            group_index.setdefault(group, project)
+            
+    return group_index
+
+@st.cache_data(ttl=CACHE_TTL)
+def get_project_by_groups(groups: frozenset):
+    """
+    Retrieves the matched project for a set of LDAP groups.
+    The result is cached by the group set, so users with different groups never share an entry.
+    """
+    group_index = get_group_project_index()
+    projects = [group_index[group] for group in groups if group in group_index]
     
     if len(projects) == 0:
-        ret_val = None
-    else:
-        ret_val = projects[0]
+        return None
     
-    return ret_val
+    # if for some reason there are multiple matches, keep the oldest project
+    return min(projects, key=lambda project: project['_id'])
+
+def get_project():
+    """
+    Retrieves the matched project for the connected user.
+    """
+    groups_field_name = st.secrets["auth"]["groups_token_field"]
+    subject_groups = st.experimental_user[groups_field_name]
+    
+    return get_project_by_groups(frozenset(subject_groups))
 
-@st.cache_data(ttl=100)
+@st.cache_data(ttl=CACHE_TTL)
 @validate_call
 def get_project_by_id(id: ObjectId):
     """
@@ -43,7 +66,7 @@ def get_project_by_id(id: ObjectId):
         
     return ret_val
 
-@st.cache_data(ttl=100)
+@st.cache_data(ttl=CACHE_TTL)
 @validate_call
 def get_project_by_name(name: str):
     """
@@ -61,7 +84,18 @@ def get_project_by_name(name: str):
         
     return ret_val
 
-@st.cache_data(ttl=100)
+@st.cache_data(ttl=CACHE_TTL)
+def get_project_names():
+    """
+    Retrieves a map of project id to project name, for all projects.
+    The projects collection is small, so this replaces joining it on every query.
+    """
+    db = get_database()
+    projects = db['projects'].find({}, { 'name': 1 })
+    
+    return { project['_id']: project['name'] for project in projects }
+
+@st.cache_data(ttl=CACHE_TTL)
 def get_projects():
     """
     Retrieves the matched project for the connected user.
@@ -90,6 +124,17 @@ def get_projects():
     
     return projects
 
+def clear_project_caches():
+    """
+    Clears the cache of all the project getter functions.
+    """
+    get_projects.clear()
+    get_group_project_index.clear()
+    get_project_by_groups.clear()
+    get_project_names.clear()
+    get_project_by_id.clear()
+    get_project_by_name.clear()
+
 @validate_call
 def upsert_projects(projects: List[Project]):
     """
@@ -98,34 +143,62 @@ def upsert_projects(projects: List[Project]):
     db = get_database()
     projects = [project.model_dump(groups_to_str=False) for project in projects] # dump model data
     
+    operations = []
+    for project in projects:
+        if project['id'] == '':
+            del project['id']
+            operations.append(InsertOne(project))
+        else:
+            project_id = _ObjectId(project.pop('id'))
+            operations.append(UpdateOne({'_id': { '$eq': project_id }}, { "$set": project }, upsert=True))
+    
     try:
-        for project in projects:
-            if project['id'] == '':
-                del project['id']
-                db['projects'].insert_one(project)
-            else:
-                project_id = _ObjectId(project.pop('id'))
-                db['projects'].update_one({'_id': { '$eq': project_id }}, { "$set": project }, upsert=True)
+        errors = bulk_write_chunked(db['projects'], operations)
     except Exception as err:
         raise Exception("Error upserting projects to db: ", err)
+    finally:
+        # clear the cache for the getter functions, some rows might have been written
+        clear_project_caches()
     
-    # clear the cache for the getter functions
-    get_projects.clear()
-    get_project.clear()
+    if len(errors) != 0:
+        # operations are built one per project, so the position is the input row
+        raise Exception("Error upserting projects to db, failed rows: ", errors)
+
+def count_project_references(db, project_ids):
+    """
+    Counts the requests and service objects referencing the projects, per collection.
+    The counts use the project indexes of these collections.
+    """
+    references = {}
+    for coll_name in ['requests', *sorted(service_collection_names)]:
+        count = db[coll_name].count_documents({ 'project': { '$in': project_ids } })
+        if count != 0:
+            references[coll_name] = count
+            
+    return references
 
 @validate_call
 def delete_projects(projects: List[Project]):
     """
-    Deletes projects in the database, by name.
+    Deletes projects in the database, by id, with one delete.
+    Projects still referenced by requests or service objects are not deleted.
+    Returns the number of deleted projects.
     """
     db = get_database()
-    projects = [project.model_dump(groups_to_str=False) for project in projects]
+    project_ids = [_ObjectId(project.id) for project in projects if project.id]
+    
+    if len(project_ids) == 0:
+        return 0
     
     try:
-        for project in projects:
-            db['projects'].delete_many({'_id': project['id']})
+        references = count_project_references(db, project_ids)
+        if len(references) != 0:
+            raise Exception(f"Projects are still referenced by objects in: {references}")
+        
+        result = db['projects'].delete_many({'_id': { '$in': project_ids }})
     except Exception as err:
         raise Exception("Error deleting projects in db: ", err)
     
-    get_projects.clear()
-    get_project.clear()
\ No newline at end of file
+    clear_project_caches()
+    
+    return result.deleted_count
\ No newline at end of file
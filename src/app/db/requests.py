@@ -1,11 +1,17 @@
 import streamlit as st
 from datetime import datetime, timezone
 from bson import ObjectId
-from mongo_db import get_database
-from db.projects import get_project
+from pymongo import UpdateOne
+from mongo_db import get_database, bulk_write_chunked, check_query_plans, REQUESTS_PAGE_SORT
+from db.projects import get_project, get_project_by_name, get_project_names
 from pydantic import validate_call
 from typing import List, TypeVar, Generic
 from utils.validation.request import Request, ActionType, StatusType
+from utils.cache import KeyedCache, CACHE_TTL
+
+# the cached request pages, grouped by project id, pages across all projects are in the ALL_PROJECTS group
+requests_cache = KeyedCache('requests', ttl=CACHE_TTL)
+ALL_PROJECTS = '*'
 
 def get_requests_by_id(ids):
     """
@@ -18,111 +24,155 @@ def get_requests_by_id(ids):
     
     return requests
 
-@st.cache_data(ttl=100)
-def get_all_requests():
+# default number of requests in a page
+PAGE_SIZE = 50
+
+def build_requests_match(filters=None, after=None):
     """
-    Retrieves the all requests.
+    Builds the $match stage for a page of requests.
+    Supported filters are status, request_type, project (name or id), date_from and date_to.
+    after is the (request_date, id) of the last request in the previous page.
     """
-    db = get_database()
-    
-    # pipeline to replace the project reference with the project name
-    pipeline = [
-        {
-            "$lookup": {
-                "from": "projects",            
-                "localField": "project",
-                "foreignField": "_id",
-                "as": "project"
-            }
-        },
-        {
-            "$addFields": {
-                "project": "$project.name",
-            }
-        },
-        { "$unwind": "$project" }
+    filters = filters or {}
+    match = {}
+    
+    if filters.get('status'):
+        match['status'] = { '$in': list(filters['status']) }
+        
+    if filters.get('request_type'):
+        match['request_type'] = { '$in': list(filters['request_type']) }
+        
+    if filters.get('project'):
+        project = filters['project']
+        if not ObjectId.is_valid(project):
+            project = get_project_by_name(project)
+            project = project['_id'] if project != None else None
+        match['project'] = { '$eq': ObjectId(project) if project != None else None }
+        
+    date_range = {}
+    if filters.get('date_from'):
+        date_range['$gte'] = filters['date_from']
+    if filters.get('date_to'):
+        date_range['$lte'] = filters['date_to']
+    if len(date_range) != 0:
+        match['request_date'] = date_range
+        
+    if after != None:
+        # keyset pagination, newest requests first
+        after_date, after_id = after
+        match['$or'] = [
+            { 'request_date': { '$lt': after_date } },
+            { 'request_date': after_date, '_id': { '$lt': ObjectId(after_id) } }
+        ]
+        
+    return match
+
+@st.cache_resource
+def check_requests_query_plans():
+    """
+    Explains the requests page queries once per process, as built for the pages, and reports the ones still doing a COLLSCAN.
+    Each supported filter is explained on its own and on the approval and project pages, first page and next pages.
+    """
+    now = datetime.now(tz=timezone.utc)
+    project_id = str(ObjectId())
+    filter_samples = [
+        {},
+        { 'status': [StatusType.APPROVAL_PENDING.value] },
+        { 'request_type': ['request_type'] },
+        { 'project': project_id },
+        { 'date_from': now, 'date_to': now },
+    ]
+    page_filters = [
+        *filter_samples,
+        *[{ **sample, 'status': [StatusType.APPROVAL_PENDING.value] } for sample in filter_samples[2:]],
+        *[{ **sample, 'project': project_id } for sample in filter_samples[1:] if 'project' not in sample],
     ]
     
-    requests = db['requests'].aggregate(pipeline)
-    
-    requests = list(requests)
-    
-    # cast to request object
-    requests = [Request(**req).model_dump(object_id_to_str=True) for req in requests]
+    queries = []
+    for filters in page_filters:
+        for after in [None, (now, str(ObjectId()))]:
+            queries.append((build_requests_match(filters, after), REQUESTS_PAGE_SORT))
+            
+    return check_query_plans(get_database(), 'requests', queries)
 
-    return requests
-
-@st.cache_data(ttl=100)
-def get_requests_for_approval():
+def get_requests_page(filters=None, after=None, page_size=PAGE_SIZE):
     """
-    Retrieves the matched requests awaiting approval.
+    Retrieves one page of requests, newest first, matching the filters.
+    Returns the requests, and the cursor of the next page (None if this is the last page).
+    The cursor is taken from the fetched documents, so requests skipped below don't end the pagination.
     """
     db = get_database()
+    check_requests_query_plans()
     
-    # pipeline to replace the project reference with the project name
-    pipeline = [
-        { "$match" : { "status" : "APPROVAL_PENDING" } },
-        {
-            "$lookup": {
-                "from": "projects",            
-                "localField": "project",
-                "foreignField": "_id",
-                "as": "project"
-            }
-        },
-        {
-            "$addFields": {
-                "project": "$project.name",
-            }
-        },
-        { "$unwind": "$project" }
-    ]
+    # one more request is fetched to know if there is a next page
+    requests = db['requests'].find(build_requests_match(filters, after)).sort(REQUESTS_PAGE_SORT).limit(page_size + 1)
+    requests = list(requests)
     
-    requests = db['requests'].aggregate(pipeline)
+    next_after = None
+    if len(requests) > page_size:
+        requests = requests[:page_size]
+        next_after = (requests[-1]['request_date'], str(requests[-1]['_id']))
     
-    requests = list(requests)
+    # replace the project reference with the project name, skip requests of deleted projects
+    project_names = get_project_names()
+    requests = [{ **req, 'project': project_names[req['project']] } for req in requests if req.get('project') in project_names]
     
     # cast to request object
     requests = [Request(**req).model_dump(object_id_to_str=True) for req in requests]
 
-    return requests
+    return { 'requests': requests, 'next_after': next_after }
 
-@st.cache_data(ttl=100)
-def get_my_requests():
+def iter_requests(filters=None, batch_size=1000):
     """
-    Retrieves the matched requests for the connected user by project.
+    Yields all the requests matching the filters, newest first, without loading them all at once.
+    This is for exporting requests.
     """
     db = get_database()
     
-    project = get_project()
+    requests = db['requests'].find(build_requests_match(filters)).sort(REQUESTS_PAGE_SORT).batch_size(batch_size)
     
-    # pipeline to replace the project reference with the project name
-    pipeline = [
-        { "$match" : { "project" : { '$eq': project['_id'] } } },
-        {
-            "$lookup": {
-                "from": "projects",            
-                "localField": "project",
-                "foreignField": "_id",
-                "as": "project"
-            }
-        },
-        {
-            "$addFields": {
-                "project": "$project.name",
-            }
-        },
-        { "$unwind": "$project" }
-    ]
-    
-    requests = db['requests'].aggregate(pipeline)
+    project_names = get_project_names()
+    for req in requests:
+        if req.get('project') not in project_names:
+            continue
+        yield Request(**{ **req, 'project': project_names[req['project']] }).model_dump(object_id_to_str=True)
+
+def get_all_requests(filters=None, after=None, page_size=PAGE_SIZE):
+    """
+    Retrieves a page of all requests.
+    """
+    return requests_cache.get(ALL_PROJECTS, ('all', filters, after, page_size), lambda: get_requests_page(filters, after, page_size))
+
+def get_requests_for_approval(filters=None, after=None, page_size=PAGE_SIZE):
+    """
+    Retrieves a page of the requests awaiting approval.
+    """
+    filters = { **(filters or {}), 'status': [StatusType.APPROVAL_PENDING.value] }
     
-    requests = list(requests)
+    return requests_cache.get(ALL_PROJECTS, ('approval', filters, after, page_size), lambda: get_requests_page(filters, after, page_size))
+
+def get_project_requests(project_id: str, filters=None, after=None, page_size=PAGE_SIZE):
+    """
+    Retrieves a page of the requests of a project.
+    """
+    filters = { **(filters or {}), 'project': project_id }
     
-    # cast to request object
-    requests = [Request(**req).model_dump(object_id_to_str=True) for req in requests]
+    return requests_cache.get(project_id, ('project', filters, after, page_size), lambda: get_requests_page(filters, after, page_size))
 
-    return requests
+def invalidate_requests_cache(project_ids):
+    """
+    Invalidates the cached pages of the given projects, and the pages across all projects.
+    """
+    requests_cache.invalidate(ALL_PROJECTS, *{ str(project_id) for project_id in project_ids })
+
+def get_my_requests(filters=None, after=None, page_size=PAGE_SIZE):
+    """
+    Retrieves a page of the requests for the connected user by project.
+    The project is resolved outside of the cached getter, so it is the cache group.
+    """
+    project = get_project()
+    
+    return get_project_requests(str(project['_id']), filters, after, page_size)
 
 @validate_call
 def update_requests(requests: List[Request]):
@@ -132,25 +182,31 @@ def update_requests(requests: List[Request]):
     db = get_database()
     requests = [request.model_dump(by_alias=True, project_name_to_id=True) for request in requests] # dump model data
     
+    operations = []
+    for request in requests:
+        request['_id'] = ObjectId(request['_id'])
+        operations.append(UpdateOne({'_id': { '$eq': request['_id'] }}, { "$set": request }))
+    
     try:
-        for request in requests:
-            request['_id'] = ObjectId(request['_id'])
-            db['requests'].update_one({'_id': { '$eq': request['_id'] }}, { "$set": request })
+        errors = bulk_write_chunked(db['requests'], operations)
     except Exception as err:
         raise Exception("Error updating requests to db: ", err)
+    finally:
+        # invalidate the cached pages of the written projects, some rows might have been written
+        invalidate_requests_cache([request['project'] for request in requests])
     
-    # clear the cache for the getter functions
-    get_requests_for_approval.clear()
-    get_my_requests.clear()
-    get_all_requests.clear()
+    if len(errors) != 0:
+        # operations are built one per request, so the position is the input row
+        raise Exception("Error updating requests to db, failed rows: ", errors)
 
 # set generic type var for the service type class
 T = TypeVar('T')
 
 @validate_call
-def insert_request(req_type: str, req_action: ActionType, request_objects: list[T] ):
+def insert_requests(req_type: str, actions: dict[ActionType, list[T]]):
     """
-    Inserts a new request to the database.
+    Inserts a new request to the database for each action, in a single transaction.
+    The timestamp, subject and project are resolved once for all the requests, and the cache is invalidated once.
     """
     db = get_database()
     
@@ -159,26 +215,37 @@ def insert_request(req_type: str, req_action: ActionType, request_objects: list[
     subject = st.experimental_user[subject_field_name]
     project = get_project()
     
-    request_objects = [ obj.model_dump() for obj in request_objects ]
-    
     try:
-        # validate request
-        request = Request(**{
-            "request_type": req_type,
-            "request_date": utc_datetime,
-            "project": project["_id"],
-            "action": req_action,
-            "status": StatusType.APPROVAL_PENDING,
-            "subject": subject,
-            "request_objects": request_objects
-        }).model_dump(by_alias=True, project_name_to_id=True)
-        new_request= db['requests'].insert_one(request)
+        requests = []
+        for req_action, request_objects in actions.items():
+            # validate request
+            requests.append(Request(**{
+                "request_type": req_type,
+                "request_date": utc_datetime,
+                "project": project["_id"],
+                "action": req_action,
+                "status": StatusType.APPROVAL_PENDING,
+                "subject": subject,
+                "request_objects": [ obj.model_dump() for obj in request_objects ]
+            }).model_dump(by_alias=True, project_name_to_id=True))
+            
+        if len(requests) == 0:
+            return None
+        
+        # all the requests of a submit are written together, or not at all
+        with db.client.start_session() as session:
+            new_requests = session.with_transaction(lambda session: db['requests'].insert_many(requests, session=session))
     except Exception as err:
-        raise Exception("Error inserting request to db: ", err)
+        raise Exception("Error inserting requests to db: ", err)
     
-    # clear the cache for the getter functions
-    get_requests_for_approval.clear()
-    get_my_requests.clear()
-    get_all_requests.clear()
+    # invalidate the cached pages of the project
+    invalidate_requests_cache([project['_id']])
     
-    return new_request
\ No newline at end of file
+    return new_requests
+
+@validate_call
+def insert_request(req_type: str, req_action: ActionType, request_objects: list[T] ):
+    """
+    Inserts a new request to the database.
+    """
+    return insert_requests(req_type, { req_action: request_objects })
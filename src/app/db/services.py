@@ -1,51 +1,46 @@
-import streamlit as st
 from bson.objectid import ObjectId
-from mongo_db import get_database
+from pymongo import InsertOne, UpdateOne
+from mongo_db import get_database, bulk_write_chunked
 from db.projects import get_project
 from pydantic import BaseModel, validate_call
 from typing import List
+from utils.cache import KeyedCache, CACHE_TTL
 import validation
 
-@st.cache_data(ttl=100)
-def get_my_service_objects(service_name: str) -> List:
+# the cached service objects, grouped by (service name, project id)
+services_cache = KeyedCache('services', ttl=CACHE_TTL)
+
+def get_project_service_objects(service_name: str, project_id: str) -> List:
     """
-    Retrieves the matched service objects for the connected user by project.
+    Retrieves the service objects of a project.
+    """
+    return services_cache.get((service_name, project_id), (), lambda: find_project_service_objects(service_name, project_id))
+
+def find_project_service_objects(service_name: str, project_id: str) -> List:
+    """
+    Finds the service objects of a project in the db.
     """
     db = get_database()
     
-    project = get_project()
-    
-    # pipeline to replace the project reference with the project name
-    pipeline = [
-        { "$match" : { "project" : { '$eq': project['_id'] } } },
-        {
-            "$lookup": {
-                "from": "projects",            
-                "localField": "project",
-                "foreignField": "_id",
-                "as": "project"
-            }
-        },
-        {
-            "$addFields": {
-                "project": "$project._id",
-                "id": { "$convert": { "input": "$_id", "to": "string" } }
-            }
-        },
-        {
-            "$project": {
-                "_id": 0
-            }    
-        },
-        { "$unwind": "$project" }
-    ]
-    
-    service_objects = db[service_name].aggregate(pipeline)
+    service_objects = db[service_name].find({ "project" : { '$eq': ObjectId(project_id) } })
     
     service_objects = list(service_objects)
     
+    # the editor works with a string id
+    for obj in service_objects:
+        obj['id'] = str(obj.pop('_id'))
+    
     return service_objects
 
+def get_my_service_objects(service_name: str) -> List:
+    """
+    Retrieves the matched service objects for the connected user by project.
+    The project is resolved outside of the cached getter, so it is part of the cache group.
+    """
+    project = get_project()
+    
+    return get_project_service_objects(service_name, str(project['_id']))
+
 @validate_call
 def upsert_services(services: List[BaseModel], service_name: str):
     """
@@ -58,18 +53,23 @@ def upsert_services(services: List[BaseModel], service_name: str):
     
     services = [service.model_dump(by_alias=True) for service in services] # dump model data
     
+    operations = []
+    for service in services:
+        if service['_id'] == None:
+            del service['_id']
+            operations.append(InsertOne(service))
+        else:
+            service['_id'] = ObjectId(service['_id'])
+            operations.append(UpdateOne({'_id': { '$eq': service['_id'] }}, { "$set": service }, upsert=True))
+    
     try:
-        print("Services")
-        for service in services:
-            print(service)
-            if service['_id'] == None:
-                del service['_id']
-                db[service_name].insert_one(service)
-            else:
-                service['_id'] = ObjectId(service['_id'])
-                db[service_name].update_one({'_id': { '$eq': service['_id'] }}, { "$set": service }, upsert=True)
+        errors = bulk_write_chunked(db[service_name], operations)
     except Exception as err:
         raise Exception("Error updating services to db: ", err)
+    finally:
+        # invalidate the cached objects of the written projects only, some rows might have been written
+        services_cache.invalidate(*{ (service_name, str(service['project'])) for service in services })
     
-    # clear the cache for the getter functions
-    get_my_service_objects.clear()
\ No newline at end of file
+    if len(errors) != 0:
+        # operations are built one per service, so the position is the input row
+        raise Exception("Error updating services to db, failed rows: ", errors)
@@ -1,7 +1,32 @@
 import streamlit as st
 import pymongo
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
 from utils.logger import logger
-        
+
+# indexes of the requests collection, the page queries filter by status or project and sort by (request_date, _id)
+REQUESTS_INDEXES = [
+    IndexModel([("status", ASCENDING), ("request_date", DESCENDING), ("_id", DESCENDING)], name="status_request_date"),
+    IndexModel([("project", ASCENDING), ("request_date", DESCENDING), ("_id", DESCENDING)], name="project_request_date"),
+    IndexModel([("request_date", DESCENDING), ("_id", DESCENDING)], name="request_date"),
+    IndexModel([("subject", ASCENDING)], name="subject"),
+]
+
+# indexes of each service collection, the service pages filter by project
+SERVICE_INDEXES = [
+    IndexModel([("project", ASCENDING)], name="project"),
+]
+
+# the max number of operations sent in one bulk write
+BULK_CHUNK_SIZE = 1000
+
+# the names of the service collections initialized in this process
+service_collection_names = set()
+
+# the sort of the requests pages
+REQUESTS_PAGE_SORT = [("request_date", DESCENDING), ("_id", DESCENDING)]
+
 # Initialize connection.
 # Uses st.cache_resource to only run once.
 @st.cache_resource
@@ -13,6 +38,66 @@ def get_database():
     
     return db
 
+def bulk_write_chunked(collection, operations, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Runs the operations as unordered bulk writes of up to chunk_size operations, one round trip per chunk.
+    A failed operation doesn't stop the others.
+    Returns a list of (operation position, error message) for the failed operations, so they can be mapped back to the input rows.
+    """
+    errors = []
+    for start in range(0, len(operations), chunk_size):
+        try:
+            collection.bulk_write(operations[start:start + chunk_size], ordered=False)
+        except BulkWriteError as err:
+            for write_error in err.details.get('writeErrors', []):
+                errors.append((start + write_error['index'], write_error['errmsg']))
+                
+    return errors
+
+def ensure_indexes(db, coll_name, indexes):
+    """
+    Creates the given indexes on the collection, existing indexes are left as is.
+    """
+    try:
+        db[coll_name].create_indexes(indexes)
+    except Exception as e:
+        logger.error(f"Couldn't create the indexes of {coll_name}: {e}")
+
+def get_plan_stages(plan):
+    """
+    Returns all the stage names in an explain plan, including the nested input stages.
+    """
+    stages = [plan.get('stage')]
+    for key in ['inputStage', 'queryPlan']:
+        if key in plan:
+            stages += get_plan_stages(plan[key])
+    for inner_plan in plan.get('inputStages', []):
+        stages += get_plan_stages(inner_plan)
+    return stages
+
+def check_query_plans(db, coll_name, queries):
+    """
+    Explains the page queries of a collection, and reports the ones still doing a COLLSCAN.
+    queries is a list of (filter, sort) tuples, the sort can be None.
+    Returns the queries doing a COLLSCAN.
+    """
+    collscans = []
+    for query_filter, sort in queries:
+        try:
+            cursor = db[coll_name].find(query_filter)
+            if sort != None:
+                cursor = cursor.sort(sort)
+            winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        except Exception as e:
+            logger.error(f"Couldn't explain a query on {coll_name}: {e}")
+            continue
+        
+        if 'COLLSCAN' in get_plan_stages(winning_plan):
+            logger.warning(f"Query on {coll_name} is doing a COLLSCAN! filter: {query_filter}, sort: {sort}")
+            collscans.append((query_filter, sort))
+            
+    return collscans
+
 def init_projects_collection(db):
     """
     Init the projects collection. 
@@ -41,8 +126,14 @@ def init_requests_collection(db):
             db.create_collection('requests')
         except Exception as e:
             logger.error(e)
+            
+    ensure_indexes(db, 'requests', REQUESTS_INDEXES)
     
+@st.cache_resource
 def init_service_collection(coll_name):
+    """
+    Init a service collection, once per process for each collection.
+    """
     db = get_database()
     coll_list = db.list_collection_names()
     
@@ -51,4 +142,8 @@ def init_service_collection(coll_name):
         try:
             db.create_collection(coll_name)
         except Exception as e:
-            logger.error(e)
\ No newline at end of file
+            logger.error(e)
+                
+    ensure_indexes(db, coll_name, SERVICE_INDEXES)
+    service_collection_names.add(coll_name)
+    check_query_plans(db, coll_name, [({ 'project': { '$eq': ObjectId() } }, None)])
\ No newline at end of file
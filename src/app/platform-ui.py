@@ -5,8 +5,23 @@ from components.pages.my_requests_page import MyRequestsPage
 from components.pages.all_requests_page import AllRequestsPage
 from components.pages.approve_requests_page import ApproveRequestsPage
 from components.pages.projects_page import ProjectsPage
+from db.cache_listener import start_cache_listener
+from utils.cache import get_cache_stats
 import validation
 
+@st.cache_resource
+def get_page_registry():
+    """
+    Builds the page objects once per process, the service pages also init their db collections here.
+    """
+    return {
+        "all_requests": AllRequestsPage(),
+        "approve_requests": ApproveRequestsPage(),
+        "projects": ProjectsPage(),
+        "my_requests": MyRequestsPage(),
+        "services": {category: [ServicePage(cls) for cls in class_list] for category, class_list in validation.classes.items()},
+    }
+
 if __name__ == '__main__':
     st.set_page_config(layout="wide")
     
@@ -21,15 +36,22 @@ if __name__ == '__main__':
     groups_field_name = st.secrets["auth"]["groups_token_field"]
     subject_groups = st.experimental_user[groups_field_name]
     
+    page_registry = get_page_registry()
+    # the service collections are known once the registry is built
+    start_cache_listener()
+    
     has_project = auth.test_user_project()
     if bool(set(subject_groups) & set(admins_groups)):
+        with st.sidebar.expander("Cache stats", icon=":material/cached:"):
+            st.json(get_cache_stats())
+            
         if not has_project:
             pages = {
-                "Admin": [ProjectsPage().get_page()]
+                "Admin": [page_registry["projects"].get_page()]
             }
         else:
             pages = {
-                "Admin": [AllRequestsPage().get_page(), ApproveRequestsPage().get_page(), ProjectsPage().get_page()]
+                "Admin": [page_registry["all_requests"].get_page(), page_registry["approve_requests"].get_page(), page_registry["projects"].get_page()]
             }
     else:
         pages = {}
@@ -39,11 +61,11 @@ if __name__ == '__main__':
         
     if has_project:
         pages.update({
-            "Main": [MyRequestsPage().get_page()]
+            "Main": [page_registry["my_requests"].get_page()]
         })
         
-        for category, class_list in validation.classes.items():
-            class_page_list = [ServicePage(cls).get_page() for cls in class_list]
+        for category, service_pages in page_registry["services"].items():
+            class_page_list = [service_page.get_page() for service_page in service_pages]
             pages.update({category: class_page_list})
             
     pg = st.navigation(pages)
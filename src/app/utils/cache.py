@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# all the keyed caches of the process, by name
+caches = {}
+
+# the ttl of the db getter caches, in seconds
+# the cache listener invalidates the entries on every write, from any replica, so this is only a safety net
+CACHE_TTL = 3 * 60 * 60
+
+# the default max number of entries of a keyed cache
+DEFAULT_MAX_ENTRIES = 1000
+
+class KeyedCache():
+    """
+    A process wide cache whose entries are grouped by an invalidation key (e.g. a project id).
+    A write only invalidates the groups it affects, instead of clearing every entry of the getter.
+    Holds at most max_entries entries, the least recently used entry is evicted first.
+    Counts hits and misses. Cached values are shared, the callers must not change them.
+    """
+    def __init__(self, name, ttl, max_entries=DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (group, args key) to (expiry, value), in least recently used order
+        self.entries = OrderedDict()
+        # the args keys of each group, to invalidate a group without scanning all the entries
+        self.group_keys = {}
+        # bumped on each invalidation, so a value computed before it is not stored after it
+        self.generations = {}
+        # bumped on each clear, for the same reason
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        caches[name] = self
+
+    def get(self, group, args, compute):
+        """
+        Returns the cached value for the args in the group, calls compute on a miss.
+        """
+        key = (group, json.dumps(args, sort_keys=True, default=str))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = (self.epoch, self.generations.get(group, 0))
+
+        value = compute()
+
+        with self.lock:
+            if (self.epoch, self.generations.get(group, 0)) == generation:
+                self.entries[key] = (now + self.ttl, value)
+                self.entries.move_to_end(key)
+                self.group_keys.setdefault(group, set()).add(key)
+                while len(self.entries) > self.max_entries:
+                    self._remove(next(iter(self.entries)))
+                    self.evictions += 1
+
+        return value
+
+    def _remove(self, key):
+        del self.entries[key]
+        group_keys = self.group_keys[key[0]]
+        group_keys.discard(key)
+        if len(group_keys) == 0:
+            del self.group_keys[key[0]]
+
+    def invalidate(self, *groups):
+        """
+        Drops all the entries of the given groups.
+        """
+        with self.lock:
+            for group in groups:
+                for key in self.group_keys.pop(group, set()):
+                    del self.entries[key]
+                self.generations[group] = self.generations.get(group, 0) + 1
+
+    def clear(self):
+        """
+        Drops all the entries.
+        """
+        with self.lock:
+            self.epoch += 1
+            self.entries = OrderedDict()
+            self.group_keys = {}
+
+    def stats(self):
+        """
+        Returns the hit, miss and eviction counters and the number of cached entries.
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+            }
+
+def get_cache_stats():
+    """
+    Returns the stats of all the keyed caches, by cache name.
+    """
+    return {name: cache.stats() for name, cache in caches.items()}
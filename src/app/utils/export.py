@@ -0,0 +1,134 @@
+import io
+import json
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.misc import df_to_records
+
+# the number of records in each parquet row group
+EXPORT_BATCH_SIZE = 5000
+
+class StreamSink(io.RawIOBase):
+    """
+    A write-only file object that keeps the written bytes until drained.
+    Keeps track of the position itself, so a parquet writer can be drained while it writes.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        """
+        Returns the bytes written since the last drain.
+        """
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_batches(records, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Groups an iterable of records into lists of batch_size records.
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) != 0:
+        yield batch
+
+def iter_df_records(df, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the dataframe rows as records, converting one slice of the dataframe at a time.
+    """
+    for start in range(0, len(df), batch_size):
+        yield from df_to_records(df.iloc[start:start + batch_size])
+
+def to_typed_value(value):
+    """
+    Converts a value to a type parquet can store. Nested values are kept as json strings, anything else (e.g. ObjectIds) as strings.
+    """
+    if value is None or isinstance(value, (str, bool, int, float, datetime)):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+def iter_ndjson(records, columns=None):
+    """
+    Yields the records as newline-delimited json, one encoded line at a time.
+    The columns are not needed, each record is written with its own keys.
+    """
+    for record in records:
+        yield (json.dumps(record, default=str) + '\n').encode()
+
+def iter_parquet(records, columns, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the bytes of a parquet file of the records, written as one row group per batch.
+    The schema has the given columns, records missing a column get a null value, and a record with another key raises an error.
+    The column types are taken from the first batch, columns with no values in it are stored as strings.
+    """
+    sink = StreamSink()
+    writer = None
+    schema = None
+    for batch in iter_batches(records, batch_size):
+        unexpected_keys = set().union(*batch) - set(columns)
+        if len(unexpected_keys) != 0:
+            raise Exception("Error exporting to parquet, records have keys that are not in the columns: ", sorted(unexpected_keys))
+        
+        batch = [{column: to_typed_value(record.get(column)) for column in columns} for record in batch]
+        if writer is None:
+            table = pa.Table.from_pylist(batch)
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in table.schema])
+            table = table.cast(schema)
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+        else:
+            table = pa.Table.from_pylist(batch, schema=schema)
+        writer.write_table(table)
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+def values_as_str(df):
+    """
+    Returns the dataframe with all values as strings, missing values as None.
+    """
+    return df.astype(str).where(df.notna(), None)
+
+def iter_parquet_chunks(file, batch_size):
+    """
+    Yields the rows of a parquet file as dataframes of batch_size rows, all values as strings.
+    """
+    parquet_file = pq.ParquetFile(file)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield values_as_str(batch.to_pandas())
+
+def export_bytes(chunks):
+    """
+    Collects the chunks of a streamed export into a file object for a download button.
+    """
+    file = io.BytesIO()
+    for chunk in chunks:
+        file.write(chunk)
+    file.seek(0)
+    return file
+
+# the streamed writer, called with the records and their columns, file extension and mime type of each export format
+EXPORT_FORMATS = {
+    'Parquet': (iter_parquet, 'parquet', 'application/vnd.apache.parquet'),
+    'NDJSON': (iter_ndjson, 'ndjson', 'application/x-ndjson'),
+}
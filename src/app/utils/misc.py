@@ -1,12 +1,12 @@
 import json
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
-import streamlit as st
+import functools
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, TemplateNotFound
 import os
 
 # jinja2 setup for the json schema templates
-# loading the environment
+# loading the environment, compiled templates are kept in a bytecode cache so they are only compiled once
 file_path = os.path.abspath(os.path.dirname(__file__))
-env = Environment(loader = FileSystemLoader(f"{file_path}/../json_schema_templates"))
+env = Environment(loader = FileSystemLoader(f"{file_path}/../json_schema_templates"), bytecode_cache=FileSystemBytecodeCache())
 json_control_mapping =  dict.fromkeys(range(32)) # the json control chars
 
 def render_jinja(template_name, **kwargs):
@@ -34,30 +34,51 @@ def get_json_schema_template_name(cls_obj):
     
     return template_name
 
-@st.cache_data
+@functools.lru_cache
+def get_json_schema_template(cls_obj):
+    """
+    Gets the compiled json schema template for the given class object, looked up once per class.
+    Returns None if the class has no template.
+    """
+    try:
+        return env.get_template(get_json_schema_template_name(cls_obj))
+    except TemplateNotFound:
+        return None
+
+def iter_json_fragments(df, cls_obj):
+    """
+    Renders the dataframe rows into json text fragments, in a single pass.
+    The rendered templates are written as is, without parsing and serializing them again.
+    Rows of classes without a template are written as their column values.
+    """
+    template = get_json_schema_template(cls_obj)
+    
+    yield '['
+    for index, row in enumerate(df_to_records(df)):
+        if index != 0:
+            yield ','
+        if template is None:
+            yield json.dumps(row)
+        else:
+            yield template.render(**row)
+    yield ']'
+
 def convert_to_json(df, cls_obj):
     """
     Converts the dataframe to a json object.
     Also replaces the string 'None' values with empty strings.
-    This functions result is cached.
+    The callers keep the result by dataframe version, so the dataframe is never hashed.
     """
-    df_to_convert = df.copy(deep=True).replace('None', '').drop(columns=['is_valid'])
-    
-    template_name = get_json_schema_template_name(cls_obj)
+    df_to_convert = df.replace('None', '').drop(columns=['is_valid'])
     
-    json_list = []
-    for row in df_to_convert.to_dict('records'):
-        try:
-            # we also remove json control chars from the result of templating!
-            rendered_schema = render_jinja(template_name, **row)
-            json_to_add = json.loads(rendered_schema)
-        except TemplateNotFound as err:
-            json_to_add = row
-            
-        json_list.append(json_to_add)
+    # we also remove json control chars from the result of templating!
+    return ''.join(iter_json_fragments(df_to_convert, cls_obj)).translate(json_control_mapping)
 
-    
-    return json.dumps(json_list)
+def df_to_records(df):
+    """
+    Converts the dataframe to a list of records, with missing values (NaN/NA of compact dtypes) as None.
+    """
+    return df.astype(object).where(df.notna(), None).to_dict('records')
 
 def highlight_is_valid(val):
     """
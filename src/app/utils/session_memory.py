@@ -0,0 +1,71 @@
+import sys
+import streamlit as st
+import pandas as pd
+from utils.logger import logger
+
+# the default memory budget of the editor pages state, per session
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+# the session key of the editor pages state registry
+REGISTRY_NAME = 'page_state_registry'
+
+def get_memory_budget():
+    """
+    Returns the per-session memory budget in bytes, set with memory_budget_mb in the session section of the secrets.
+    """
+    session_secrets = st.secrets.get("session", {})
+    return int(session_secrets.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)) * 1024 * 1024
+
+def get_state_size(value):
+    """
+    Returns the approximate memory size of a session state value in bytes.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (set, list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(key) + sys.getsizeof(item) for key, item in value.items())
+    return sys.getsizeof(value)
+
+def register_page_state(page_name, state_names, version, has_pending_changes):
+    """
+    Records the session state keys of the page being viewed, and their size.
+    The size is only measured again when the page data version changed.
+    """
+    registry = st.session_state.setdefault(REGISTRY_NAME, {})
+    entry = registry.pop(page_name, None)
+    if entry is None or entry['version'] != version:
+        size = sum(get_state_size(st.session_state[name]) for name in state_names if name in st.session_state)
+        entry = {'version': version, 'size': size}
+
+    entry['state_names'] = state_names
+    entry['has_pending_changes'] = has_pending_changes
+    # the registry is kept in viewing order, the page viewed last is at the end
+    registry[page_name] = entry
+
+def enforce_memory_budget(current_page_name):
+    """
+    Evicts the state of the least recently viewed pages while the session is over its memory budget.
+    The page being viewed and pages with changes that were not submitted yet are never evicted.
+    Evicted pages load their data from the db again when they are viewed.
+    """
+    registry = st.session_state.get(REGISTRY_NAME, {})
+    budget = get_memory_budget()
+    total_size = sum(entry['size'] for entry in registry.values())
+
+    for page_name in list(registry.keys()):
+        if total_size <= budget:
+            break
+        entry = registry[page_name]
+        if page_name == current_page_name or entry['has_pending_changes']:
+            continue
+
+        for name in entry['state_names']:
+            st.session_state.pop(name, None)
+        total_size -= entry['size']
+        del registry[page_name]
+        logger.info(f"Evicted the session state of page {page_name} ({entry['size']} bytes) to stay in the memory budget.")
+
+    if total_size > budget:
+        st.warning("This session is holding a lot of data! Please submit or discard your changes on other pages.", icon=":material/memory:")
@@ -1,6 +1,6 @@
 from pydantic import Field, ConfigDict, conlist, BaseModel, field_validator
 from datetime import datetime
-from typing import Optional, Union
+from typing import Any, Optional, Union
 from .generic import CustomBaseModel
 from utils.validation.types import ObjectId
 from bson import ObjectId as _ObjectId
@@ -41,6 +41,10 @@ class Request(BaseModel):
     request_objects: conlist(CustomBaseModel, min_length=1) = Field(description="The request objects, in the form of a list of objects. \
         These will be passed to the backend in an API call!")
     
+    object_results: Optional[list[dict[str, Any]]] = Field(description="The execution result of each request object, written by the requests runner.", default=None)
+    
+    progress: Optional[dict[str, int]] = Field(description="The execution progress of the request (total, done and failed objects), written by the requests runner.", default=None)
+    
     @field_validator('project', mode='after')  
     @classmethod
     def is_valid_project(cls, value: str) -> str:
@@ -57,7 +61,7 @@ class Request(BaseModel):
         model_dump = super().model_dump(**kwargs)
         
         # if field is None, dont return it!
-        none_fields = ['id', '_id']
+        none_fields = ['id', '_id', 'object_results', 'progress']
         none_fields = list(set(none_fields) & set(model_dump.keys()))
         for field in none_fields:
             if model_dump[field] == None:
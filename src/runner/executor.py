@@ -0,0 +1,95 @@
+import asyncio
+import json
+import threading
+import time
+import aiohttp
+from logger import logger
+
+# the http method used for each request action
+ACTION_METHODS = {
+    'CREATE': 'POST',
+    'UPDATE': 'PUT',
+    'DELETE': 'DELETE',
+}
+
+class RequestExecutor():
+    """
+    Executes the request objects of approved requests through an async http client.
+    The event loop runs in its own thread, so the runner's worker threads share one connection pool.
+    Concurrency is bounded per request type.
+    """
+    def __init__(self, base_url, max_connections=100, concurrency_per_type=20, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.concurrency_per_type = concurrency_per_type
+        self.timeout = timeout
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.session = None
+        self.semaphores = {}
+
+    def start(self):
+        """
+        Starts the event loop thread and opens the shared http session.
+        """
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._open_session(), self.loop).result()
+
+    def close(self):
+        """
+        Closes the http session and stops the event loop thread.
+        """
+        if self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def execute(self, request, on_result=None):
+        """
+        Executes all the request objects of the request, blocks until all are done.
+        Returns a result for each object, in the same order as request_objects.
+        on_result is called with each result as soon as its object is done, from the event loop thread.
+        """
+        return asyncio.run_coroutine_threadsafe(self._execute_request(request, on_result), self.loop).result()
+
+    async def _open_session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def _get_semaphore(self, request_type):
+        # only touched from the event loop thread, so no lock is needed
+        if request_type not in self.semaphores:
+            self.semaphores[request_type] = asyncio.Semaphore(self.concurrency_per_type)
+        return self.semaphores[request_type]
+
+    async def _execute_request(self, request, on_result):
+        request_type = request['request_type']
+        method = ACTION_METHODS[request['action']]
+        url = f"{self.base_url}/{request_type}"
+        semaphore = self._get_semaphore(request_type)
+
+        tasks = [self._execute_object(semaphore, method, url, index, obj, on_result) for index, obj in enumerate(request['request_objects'])]
+        return await asyncio.gather(*tasks)
+
+    async def _execute_object(self, semaphore, method, url, index, obj, on_result):
+        result = {'index': index, 'ok': False, 'status_code': None, 'error': None, 'elapsed_ms': None}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # ObjectIds and dates are sent as strings
+                body = json.dumps(obj, default=str)
+                async with self.session.request(method, url, data=body, headers={'Content-Type': 'application/json'}) as response:
+                    result['status_code'] = response.status
+                    result['ok'] = response.status < 400
+                    if not result['ok']:
+                        result['error'] = await response.text()
+            except Exception as err:
+                logger.warning(f"Failed executing object {index} on {url}: {err}")
+                result['error'] = str(err)
+            result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+
+        if on_result is not None:
+            on_result(result)
+
+        return result
@@ -0,0 +1,87 @@
+import threading
+from pymongo import UpdateOne
+from logger import logger
+
+class ProgressBuffer():
+    """
+    Buffers the per-object execution results of requests, and writes them to the requests collection with one bulk_write.
+    A flush happens every batch_size results or every interval_ms milliseconds, whichever comes first.
+    Only requests still IN_PROGRESS with lease_owner as their lease owner are written, so a runner that lost its lease
+    doesn't overwrite the results of the run that re-claimed the request.
+    """
+    def __init__(self, collection, lease_owner, batch_size=100, interval_ms=500):
+        self.collection = collection
+        self.lease_owner = lease_owner
+        self.batch_size = batch_size
+        self.interval_ms = interval_ms
+
+        self.pending = []
+        self.lock = threading.Lock()
+        # serializes flushes, so results of the same request are written in order
+        self.flush_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+
+    def start(self):
+        """
+        Starts the background flush thread.
+        """
+        self.thread.start()
+
+    def close(self):
+        """
+        Stops the background flush thread and writes what is left in the buffer.
+        """
+        self.stop_event.set()
+        self.flush_event.set()
+        self.thread.join()
+        self.flush()
+
+    def add(self, request_id, result):
+        """
+        Adds the result of one request object to the buffer. Safe to call from any thread, never writes to the db itself.
+        """
+        with self.lock:
+            self.pending.append((request_id, result))
+            if len(self.pending) >= self.batch_size:
+                self.flush_event.set()
+
+    def flush(self):
+        """
+        Writes all the buffered results, merged into one update per request.
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending = self.pending
+                self.pending = []
+
+            if len(pending) == 0:
+                return
+
+            updates = {}
+            for request_id, result in pending:
+                update = updates.setdefault(request_id, {'$set': {}, '$inc': {'progress.done': 0, 'progress.failed': 0}})
+                prefix = f"object_results.{result['index']}"
+                update['$set'][f"{prefix}.status"] = 'COMPLETED' if result['ok'] else 'FAILED'
+                update['$set'][f"{prefix}.status_code"] = result['status_code']
+                update['$set'][f"{prefix}.error"] = result['error']
+                update['$set'][f"{prefix}.elapsed_ms"] = result['elapsed_ms']
+                update['$inc']['progress.done'] += 1
+                if not result['ok']:
+                    update['$inc']['progress.failed'] += 1
+
+            operations = [
+                UpdateOne({'_id': request_id, 'status': 'IN_PROGRESS', 'lease_owner': self.lease_owner}, update)
+                for request_id, update in updates.items()
+            ]
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                logger.exception(e)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.flush_event.wait(self.interval_ms / 1000)
+            self.flush_event.clear()
+            self.flush()
@@ -3,22 +3,208 @@ from dotenv import load_dotenv
 import pymongo
 from json import dumps
 from logger import logger
+from executor import RequestExecutor
+from progress import ProgressBuffer
 import threading
 import queue
+import signal
+import time
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
 
 def worker(**kwargs):
+    """
+    Handles the requests routed to this worker's queue, one at a time.
+    A None item is the shutdown sentinel.
+    """
     queue = kwargs['queue']
     request_id_set = kwargs['request_id_set']
+    request_id_lock = kwargs['request_id_lock']
     while True:
         item = queue.get()
+        if item is None:
+            queue.task_done()
+            break
+
         request_id = item['_id']
-        
-        logger.info(f'Working on {item}')
-        logger.info(f'Finished {item}')
-        
-        queue.task_done()
-        request_id_set.remove(request_id)
-        logger.info(f"In worker thread {request_id_set}")
+
+        try:
+            # claim the request, another runner replica might have taken it already
+            item = claim_request(request_id)
+            if item is None:
+                logger.info(f'Request {request_id} was claimed by another runner, skipping.')
+                continue
+
+            try:
+                logger.info(f'Working on {request_id}')
+                results = executor.execute(item, on_result=lambda result: progress_buffer.add(request_id, result))
+                failed = [result for result in results if not result['ok']]
+                logger.info(f'Finished {request_id}, {len(results) - len(failed)}/{len(results)} objects succeeded')
+                # write the last object results before the final status
+                progress_buffer.flush()
+                release_request(request_id, 'FAILED' if len(failed) != 0 else 'COMPLETED')
+            except Exception as e:
+                logger.exception(e)
+                progress_buffer.flush()
+                release_request(request_id, 'FAILED')
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            queue.task_done()
+            with request_id_lock:
+                request_id_set.discard(request_id)
+
+def lease_expiry():
+    """
+    Returns the expiry date for a lease taken or renewed now.
+    """
+    return datetime.now(tz=timezone.utc) + timedelta(seconds=RUNNER_LEASE_SECONDS)
+
+def claim_request(request_id):
+    """
+    Atomically moves an approved request to IN_PROGRESS with this runner as the lease owner.
+    Also resets the per-object results and the progress of the request.
+    Returns the claimed request, None if it is no longer approved (claimed by another runner).
+    """
+    request = db['requests'].find_one_and_update(
+        {'_id': request_id, 'status': 'APPROVED'},
+        [{'$set': {
+            'status': 'IN_PROGRESS',
+            'lease_owner': RUNNER_ID,
+            'lease_expires_at': lease_expiry(),
+            'object_results': { '$map': { 'input': '$request_objects', 'in': { 'status': 'PENDING' } } },
+            'progress': { 'total': { '$size': '$request_objects' }, 'done': 0, 'failed': 0 },
+        }}],
+        projection={field: 1 for field in REQUEST_FIELDS},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if request is not None:
+        with lease_lock:
+            leased_request_ids.add(request_id)
+    return request
+
+def release_request(request_id, status):
+    """
+    Sets the final status of a request held by this runner and drops the lease.
+    """
+    try:
+        db['requests'].update_one(
+            {'_id': request_id, 'status': 'IN_PROGRESS', 'lease_owner': RUNNER_ID},
+            {'$set': {'status': status}, '$unset': {'lease_owner': '', 'lease_expires_at': ''}}
+        )
+    finally:
+        with lease_lock:
+            leased_request_ids.discard(request_id)
+
+def lease_keeper():
+    """
+    Renews the leases of the requests this runner holds, and returns requests with expired leases to APPROVED.
+    Requests returned to APPROVED show up in the change stream again, so any runner replica can pick them up.
+    """
+    while not lease_stop_event.wait(RUNNER_HEARTBEAT_INTERVAL):
+        try:
+            with lease_lock:
+                held_ids = list(leased_request_ids)
+            if len(held_ids) != 0:
+                db['requests'].update_many(
+                    {'_id': {'$in': held_ids}, 'status': 'IN_PROGRESS', 'lease_owner': RUNNER_ID},
+                    {'$set': {'lease_expires_at': lease_expiry()}}
+                )
+
+            reaped = db['requests'].update_many(
+                {'status': 'IN_PROGRESS', 'lease_expires_at': {'$lt': datetime.now(tz=timezone.utc)}},
+                {'$set': {'status': 'APPROVED'}, '$unset': {'lease_owner': '', 'lease_expires_at': ''}}
+            )
+            if reaped.modified_count != 0:
+                logger.warning(f"Returned {reaped.modified_count} requests with expired leases to APPROVED.")
+        except Exception as e:
+            logger.exception(e)
+
+def dispatch(doc):
+    """
+    Routes the request to a worker queue by its id, so requests with the same id are always handled in order by the same worker.
+    Blocks while that worker's queue is full.
+    """
+    request_id = doc['_id']
+    with request_id_lock:
+        if request_id in request_id_set:
+            return
+        request_id_set.add(request_id)
+
+    worker_queue = task_queues[hash(str(request_id)) % RUNNER_WORKERS]
+    while not stop_event.is_set():
+        try:
+            worker_queue.put(doc, timeout=1)
+            return
+        except queue.Full:
+            continue
+
+def load_checkpoint():
+    """
+    Loads the last saved resume token of the runner, None if there is none.
+    """
+    state = db['runner_state'].find_one({'_id': RUNNER_STATE_ID})
+    if state is None:
+        return None
+    return state.get('resume_token')
+
+def save_checkpoint(resume_token):
+    """
+    Saves the resume token of the last read change, so a restart continues from it.
+    """
+    if resume_token is None:
+        return
+    db['runner_state'].update_one(
+        {'_id': RUNNER_STATE_ID},
+        {'$set': {'resume_token': resume_token, 'updated_at': datetime.now(tz=timezone.utc)}},
+        upsert=True
+    )
+
+def catch_up():
+    """
+    Dispatches the requests that are already approved, but might have been missed while the runner was down.
+    Only requests in the APPROVED status are queried, the rest of the history is never rescanned.
+    """
+    logger.info("Catching up on approved requests.")
+    count = 0
+    for doc in db['requests'].find({'status': 'APPROVED'}, {field: 1 for field in REQUEST_FIELDS}):
+        if stop_event.is_set():
+            break
+        dispatch(doc)
+        count += 1
+    logger.info(f"Caught up on {count} approved requests.")
+
+def count_stream_events():
+    """
+    Counts every change event of the requests collection, with only the event ids sent by the server.
+    This is what the runner would receive without the server side filter, one event per changed document,
+    including the runner's own claims, heartbeats and progress writes.
+    """
+    while not stop_event.is_set():
+        try:
+            with db['requests'].watch([{'$project': {'_id': 1}}], max_await_time_ms=1000) as change_stream:
+                while not stop_event.is_set() and change_stream.alive:
+                    if change_stream.try_next() is not None:
+                        stream_stats['total'] += 1
+        except Exception as e:
+            logger.exception(e)
+            stop_event.wait(RUNNER_STATS_INTERVAL)
+
+def log_stream_stats():
+    """
+    Logs how many change events reached the runner, and how many change events of the requests collection were filtered out by the server.
+    Both counts start when the runner starts. Events replayed from the checkpoint are only in the received count.
+    """
+    stream_stats['filtered'] = max(stream_stats['total'] - stream_stats['received'], 0)
+    logger.info(f"Change stream stats: {stream_stats['received']} events received, {stream_stats['filtered']} of {stream_stats['total']} events filtered out by the server.")
+
+def shutdown(signum, frame):
+    """
+    Stops reading the change stream, the workers drain their queues afterwards.
+    """
+    logger.info(f"Got signal {signum}, shutting down.")
+    stop_event.set()
 
 load_dotenv()  # take environment variables
 
@@ -27,7 +213,24 @@ MONGO_DB_HOST = os.getenv('MONGO_DB_HOST')
 MONGO_DB_PORT = int(os.getenv('MONGO_DB_PORT'))
 MONGO_DB_USERNAME = os.getenv('MONGO_DB_USERNAME')
 MONGO_DB_PASSWORD = os.getenv('MONGO_DB_PASSWORD')
-        
+RUNNER_WORKERS = int(os.getenv('RUNNER_WORKERS', 4))
+RUNNER_QUEUE_SIZE = int(os.getenv('RUNNER_QUEUE_SIZE', 10))
+# the lease owner, unique per process: a restarted runner never resumes its old leases, they are reaped
+RUNNER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+RUNNER_STATE_ID = os.getenv('RUNNER_STATE_ID', 'requests-runner')
+EXECUTOR_URL = os.getenv('EXECUTOR_URL', 'http://localhost:8080')
+EXECUTOR_MAX_CONNECTIONS = int(os.getenv('EXECUTOR_MAX_CONNECTIONS', 100))
+EXECUTOR_CONCURRENCY_PER_TYPE = int(os.getenv('EXECUTOR_CONCURRENCY_PER_TYPE', 20))
+EXECUTOR_TIMEOUT = float(os.getenv('EXECUTOR_TIMEOUT', 30))
+RUNNER_PROGRESS_BATCH_SIZE = int(os.getenv('RUNNER_PROGRESS_BATCH_SIZE', 100))
+RUNNER_PROGRESS_INTERVAL_MS = float(os.getenv('RUNNER_PROGRESS_INTERVAL_MS', 500))
+RUNNER_LEASE_SECONDS = float(os.getenv('RUNNER_LEASE_SECONDS', 60))
+RUNNER_HEARTBEAT_INTERVAL = float(os.getenv('RUNNER_HEARTBEAT_INTERVAL', RUNNER_LEASE_SECONDS / 3))
+RUNNER_CHECKPOINT_INTERVAL = float(os.getenv('RUNNER_CHECKPOINT_INTERVAL', 5))
+RUNNER_STATS_INTERVAL = float(os.getenv('RUNNER_STATS_INTERVAL', 0))
+# change stream errors meaning the resume token is no longer in the oplog
+RESUME_TOKEN_LOST_CODES = (280, 286)
+
 # Initialize connection.
 logger.info("Init mongo connection.")
 try:
@@ -36,42 +239,129 @@ try:
 except Exception as e:
     logger.exception(e)
 
-pipeline = [{
-    '$match': {
-        'operationType': { '$in': ['update'] },
+# the request fields the executor needs
+REQUEST_FIELDS = ['_id', 'request_type', 'project', 'action', 'status', 'request_objects']
+
+# only status transitions to APPROVED reach the runner, the rest is filtered by the server
+pipeline = [
+    {
+        '$match': {
+            'operationType': { '$in': ['update', 'replace'] },
+            '$or': [
+                { 'updateDescription.updatedFields.status': 'APPROVED' },
+                { 'operationType': 'replace', 'fullDocument.status': 'APPROVED' }
+            ]
+        }
+    },
+    {
+        '$project': {
+            'operationType': 1,
+            'documentKey': 1,
+            **{f'fullDocument.{field}': 1 for field in REQUEST_FIELDS}
+        }
     }
-}]
-#  'fullDocument.action': 'APPROVED'
-logger.info("Init queue.")
-# init queue for task execution
-task_queue = queue.Queue()
-# set to keep all request ids, to avoid duplicates in task queue
+]
+logger.info("Init queues.")
+# one bounded queue per worker, requests are routed by id to keep per-request ordering
+task_queues = [queue.Queue(maxsize=RUNNER_QUEUE_SIZE) for _ in range(RUNNER_WORKERS)]
+# set to keep all request ids, to avoid duplicates in task queues
 request_id_set = set()
-# Turn-on the worker thread.
-threading.Thread(target=worker, kwargs={'queue': task_queue, 'request_id_set': request_id_set}, daemon=True).start()
-
-max_queue_size = 10
-logger.info("Start execution.")
-resume_token = None
-while True:
-    change_stream = db['requests'].watch(pipeline, full_document="updateLookup")
+request_id_lock = threading.Lock()
+stop_event = threading.Event()
+# ids of the requests this runner holds a lease on
+leased_request_ids = set()
+lease_lock = threading.Lock()
+lease_stop_event = threading.Event()
+# counters to measure how many change events the stream filter saves
+stream_stats = {'received': 0, 'filtered': 0, 'total': 0}
+
+signal.signal(signal.SIGTERM, shutdown)
+signal.signal(signal.SIGINT, shutdown)
+
+# Start the executor, shared by all the workers.
+executor = RequestExecutor(EXECUTOR_URL, max_connections=EXECUTOR_MAX_CONNECTIONS, concurrency_per_type=EXECUTOR_CONCURRENCY_PER_TYPE, timeout=EXECUTOR_TIMEOUT)
+executor.start()
+
+# Start the progress buffer, per-object results are written in bulk.
+progress_buffer = ProgressBuffer(db['requests'], RUNNER_ID, batch_size=RUNNER_PROGRESS_BATCH_SIZE, interval_ms=RUNNER_PROGRESS_INTERVAL_MS)
+progress_buffer.start()
+
+# Turn-on the worker threads.
+logger.info(f"Starting {RUNNER_WORKERS} workers.")
+workers = []
+for task_queue in task_queues:
+    worker_thread = threading.Thread(target=worker, kwargs={'queue': task_queue, 'request_id_set': request_id_set, 'request_id_lock': request_id_lock})
+    worker_thread.start()
+    workers.append(worker_thread)
+
+# Turn-on the lease heartbeat and reaper thread.
+lease_thread = threading.Thread(target=lease_keeper)
+lease_thread.start()
+
+# Turn-on the event counting stream, only used for the stream stats.
+stats_thread = None
+if RUNNER_STATS_INTERVAL > 0:
+    stats_thread = threading.Thread(target=count_stream_events)
+    stats_thread.start()
+
+logger.info(f"Start execution as runner {RUNNER_ID}.")
+resume_token = load_checkpoint()
+# the catch-up runs once the stream is open, so a request approved in between is in one of them at least
+needs_catch_up = True
+while not stop_event.is_set():
     try:
-        for change in change_stream:
-            print(change)
-            doc = change['fullDocument']
-            logger.info(doc)
-            print(doc)
-            print('') # for readability only
-            
-            request_id = doc['_id']
-            if request_id not in request_id_set:
-                request_id_set.add(request_id)   
-                logger.info(f"In normal thread before worker {request_id_set}")
-                task_queue.put(doc)
-                task_queue.join()
-            
-            logger.info(f"In normal thread after worker {request_id_set}")
+        if resume_token is not None:
+            logger.info("Resuming change stream from checkpoint.")
+        with db['requests'].watch(pipeline, full_document="updateLookup", max_await_time_ms=1000, resume_after=resume_token) as change_stream:
+            # keep the start position of the stream, in case it fails before the first event
             resume_token = change_stream.resume_token
+            if needs_catch_up:
+                catch_up()
+                needs_catch_up = False
+            last_checkpoint = time.monotonic()
+            last_stats = time.monotonic()
+            while not stop_event.is_set() and change_stream.alive:
+                change = change_stream.try_next()
+                if change is not None:
+                    stream_stats['received'] += 1
+                    doc = change.get('fullDocument')
+                    logger.info(doc)
+
+                    # the request could have been deleted before the lookup
+                    if doc is not None:
+                        dispatch(doc)
+
+                resume_token = change_stream.resume_token
+                if time.monotonic() - last_checkpoint >= RUNNER_CHECKPOINT_INTERVAL:
+                    save_checkpoint(resume_token)
+                    last_checkpoint = time.monotonic()
+                if RUNNER_STATS_INTERVAL > 0 and time.monotonic() - last_stats >= RUNNER_STATS_INTERVAL:
+                    log_stream_stats()
+                    last_stats = time.monotonic()
+            save_checkpoint(resume_token)
+    except pymongo.errors.OperationFailure as e:
+        if e.code in RESUME_TOKEN_LOST_CODES:
+            logger.warning("The resume token is no longer in the oplog, catching up and starting from now.")
+            resume_token = None
+            needs_catch_up = True
+        else:
+            logger.exception(e)
+            logger.info("Trying to use resume token to continue...")
     except Exception as e:
         logger.exception(e)
         logger.info("Trying to use resume token to continue...")
+
+# drain the queues and stop the workers
+logger.info("Draining worker queues.")
+for task_queue in task_queues:
+    task_queue.put(None)
+for worker_thread in workers:
+    worker_thread.join()
+lease_stop_event.set()
+lease_thread.join()
+executor.close()
+progress_buffer.close()
+if stats_thread is not None:
+    stats_thread.join()
+    log_stream_stats()
+logger.info("All workers stopped.")